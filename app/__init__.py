@@ -7,8 +7,11 @@ from flask_socketio import SocketIO
 from flask_wtf.csrf import CSRFProtect  # ««« 1. IMPORT THIS
 import os
 from flask_mail import Mail
+from app.socketio_queue import client_manager_options
+from app import sqlite_profile
+from app.db_routing import RoutingSession, REPLICA_BIND, replica_bind
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
@@ -21,14 +24,27 @@ mail = Mail()
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # Explicit SQLALCHEMY_ENGINE_OPTIONS win over the SQLite profile's
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **sqlite_profile.engine_options(app.config), **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
+
+    replica = replica_bind(app.config)
+    if replica:
+        app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), REPLICA_BIND: replica}
 
     db.init_app(app)
+    sqlite_profile.init_app(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
-    socketio.init_app(app, async_mode='eventlet') 
+    socketio.init_app(app, async_mode=app.config['SOCKETIO_ASYNC_MODE'], serializer=app.config['SOCKETIO_SERIALIZER'],
+                      **client_manager_options(app.config))
     csrf.init_app(app)  # ««« 3. INITIALIZE THE APP HERE
     mail.init_app(app)
 
+    from app import jobs
+    jobs.init_app(app)
+
     # Ensure upload folder exists
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -40,6 +56,9 @@ def create_app(config_class=Config):
     from app.chat import bp as chat_bp
     app.register_blueprint(chat_bp, url_prefix='/chat')
 
+    from app.chat import codec
+    codec.subscriptions.init_app(app)
+
     @app.route('/')
     def index():
         """Main entry point, redirects to chat or login."""
@@ -0,0 +1,122 @@
+import threading
+from flask import current_app
+from app import socketio
+from app import metrics
+from app.chat import codec
+
+
+def message_room(room_id, batched=False, compact=False):
+    """
+    Socket.IO room that receives a chat room's new messages: "<id>|m" for
+    per-message clients ("<id>|m|c" with compact field codes), "<id>|b" for
+    clients that joined with batch=True. Everything else for the room
+    (typing, attachment updates) still goes to "<id>". Only room members
+    are put in any of these rooms (see the join handler).
+    """
+    return f"{room_id}|b" if batched else codec.variant(f"{room_id}|m", compact)
+
+
+def message_kind(batched=False, compact=False):
+    """The codec.subscriptions kind of a message_room: its suffix."""
+    return message_room('', batched, compact)
+
+
+def encode_batch(room_id, messages):
+    """
+    Columnar `message_batch` envelope: one list per field instead of one dict
+    per message, sender names once per sender, timestamps as epoch
+    milliseconds, attachments as sparse [index, attachment] pairs, and the
+    indexes of forwarded messages.
+    """
+    senders = {}
+    for msg in messages:
+        senders.setdefault(str(msg['sender_id']), msg['sender_name'])
+    return {
+        'room_id': room_id,
+        'senders': senders,
+        'id': [msg['id'] for msg in messages],
+        'sender_id': [msg['sender_id'] for msg in messages],
+        'content': [msg['content'] for msg in messages],
+        'ts': [codec.epoch_ms(msg['timestamp']) for msg in messages],
+        'attachments': [[i, msg['attachment']] for i, msg in enumerate(messages) if msg['attachment']],
+        'forwarded': [i for i, msg in enumerate(messages) if msg.get('is_forward')],
+    }
+
+
+class MessageBatcher:
+    """
+    Broadcasts new messages. Per-message clients get a `message` right away;
+    batch clients get every message a room produced in the last
+    `MESSAGE_BATCH_INTERVAL` seconds as one `message_batch` frame (see
+    encode_batch), in the order they were published. A busy room then costs
+    a batch client one frame per tick instead of one per message. Variants
+    no connection subscribes to are skipped (see codec.Subscriptions).
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.frames = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self._app = None
+
+    def publish(self, room_id, msg_data):
+        """Sends a committed message's payload to the room's subscribers."""
+        if codec.subscriptions.used(message_kind()):
+            socketio.send(msg_data, to=message_room(room_id))
+        if codec.subscriptions.used(message_kind(compact=True)):
+            socketio.send(codec.encode('message', msg_data), to=message_room(room_id, compact=True))
+        self._queue(room_id, [msg_data])
+
+    def publish_many(self, room_id, messages):
+        """
+        Like publish for several committed messages at once (a forward):
+        per-message clients get them in one `messages` event.
+        """
+        payload = {'room_id': room_id, 'messages': messages}
+        if codec.subscriptions.used(message_kind()):
+            socketio.emit('messages', payload, to=message_room(room_id))
+        if codec.subscriptions.used(message_kind(compact=True)):
+            socketio.emit('messages', codec.encode('message', payload), to=message_room(room_id, compact=True))
+        self._queue(room_id, messages)
+
+    def _queue(self, room_id, messages):
+        interval = current_app.config['MESSAGE_BATCH_INTERVAL']
+        with self._lock:
+            self.published += len(messages)
+            if not codec.subscriptions.used(message_kind(batched=True)):
+                return
+            self._pending.setdefault(room_id, []).extend(messages)
+            if interval > 0 and self._task is None:
+                self._app = current_app._get_current_object()
+                self._task = socketio.start_background_task(self._run, interval)
+        if interval <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self.frames += len(pending)
+        for room_id, messages in pending.items():
+            socketio.emit('message_batch', encode_batch(room_id, messages), to=message_room(room_id, batched=True))
+
+    def _run(self, interval):
+        while True:
+            socketio.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self._app.logger.error(f"Error flushing message batches: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'published': self.published,
+                'batch_frames': self.frames,
+                'pending_rooms': len(self._pending),
+            }
+
+
+message_batcher = MessageBatcher()
+metrics.register('message_batches', message_batcher.stats)
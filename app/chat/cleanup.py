@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db, socketio
+from app import jobs
+from app.models import ChatRoom, ChatMessage, ChatMessageAttachment, PendingUpload
+from app.chat.uploads import cancel_upload
+
+# Attachment and room cleanup, run by app.jobs off the request path. Deleting
+# an attachment row releases its blob; the store removes the file once no
+# message references it any more (app/chat/storage.py).
+
+
+def _remove_attachment(attachment, notice):
+    message = attachment.message
+    message.content = notice
+    db.session.delete(attachment)
+    return {'attachment_id': attachment.id, 'message_id': message.id}, message.room_id
+
+
+@jobs.task('attachments.delete_viewed')
+def delete_viewed_attachment(attachment_id):
+    """View-once: removes an attachment after its recipient downloaded it."""
+    attachment = db.session.get(ChatMessageAttachment, attachment_id)
+    if attachment is None:
+        return
+    payload, room_id = _remove_attachment(attachment, "[Attachment downloaded and removed]")
+    db.session.commit()
+    socketio.emit('attachment_deleted', payload, to=str(room_id))
+
+
+@jobs.task('attachments.sweep_viewed')
+def sweep_viewed_attachments():
+    """
+    Removes attachments viewed more than VIEWED_ATTACHMENT_MAX_AGE ago that
+    are still around (an offloaded download, or a failed delete job),
+    committing every ATTACHMENT_CLEANUP_BATCH rows. The age counts from the
+    view, so a front server still sending a just-viewed file keeps it.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['VIEWED_ATTACHMENT_MAX_AGE'])
+    batch_size = current_app.config['ATTACHMENT_CLEANUP_BATCH']
+    while True:
+        batch = ChatMessageAttachment.query.filter(
+            ChatMessageAttachment.viewed == True,
+            ChatMessageAttachment.viewed_at < cutoff
+        ).order_by(ChatMessageAttachment.id).limit(batch_size).all()
+        if not batch:
+            return
+        removed = [_remove_attachment(attachment, "[Attachment downloaded and removed]") for attachment in batch]
+        db.session.commit()
+        for payload, room_id in removed:
+            socketio.emit('attachment_deleted', payload, to=str(room_id))
+
+
+@jobs.task('rooms.purge')
+def purge_room(room_id):
+    """
+    Deletes a conversation whose participants were already removed: its
+    attachments (releasing their blobs), messages, pending uploads and the
+    room row, in batches of ATTACHMENT_CLEANUP_BATCH so no single transaction
+    holds the write lock for long.
+    """
+    batch_size = current_app.config['ATTACHMENT_CLEANUP_BATCH']
+    while True:
+        batch = ChatMessageAttachment.query.join(ChatMessage).filter(
+            ChatMessage.room_id == room_id
+        ).limit(batch_size).all()
+        if not batch:
+            break
+        for attachment in batch:
+            db.session.delete(attachment)
+        db.session.commit()
+
+    for upload in PendingUpload.query.filter_by(room_id=room_id).all():
+        cancel_upload(upload)
+
+    ChatRoom.query.filter_by(id=room_id).update({ChatRoom.last_message_id: None}, synchronize_session=False)
+    while True:
+        ids = [message_id for (message_id,) in db.session.query(ChatMessage.id)
+               .filter(ChatMessage.room_id == room_id).limit(batch_size)]
+        if not ids:
+            break
+        ChatMessage.query.filter(ChatMessage.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+    room = db.session.get(ChatRoom, room_id)
+    if room is not None:
+        db.session.delete(room)
+    db.session.commit()
+
+
+@jobs.task('uploads.expire')
+def expire_pending_uploads():
+    """Drops chunked uploads not finished within UPLOAD_EXPIRE_AFTER, with their partial files."""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['UPLOAD_EXPIRE_AFTER'])
+    stale = PendingUpload.query.filter(PendingUpload.created_at < cutoff).limit(
+        current_app.config['ATTACHMENT_CLEANUP_BATCH']
+    ).all()
+    for upload in stale:
+        cancel_upload(upload)
+
+
+jobs.periodic('attachments.sweep_viewed', 'ATTACHMENT_CLEANUP_INTERVAL')
+jobs.periodic('uploads.expire', 'ATTACHMENT_CLEANUP_INTERVAL')
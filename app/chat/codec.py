@@ -0,0 +1,122 @@
+import threading
+from datetime import datetime, timezone
+from flask import session
+from app import metrics
+from app.chat import bp
+
+COMPACT = 'compact'
+
+# Short field codes for the hot realtime events, per event. Nested objects
+# (attachments, unread updates) use the same table as their event.
+FIELD_CODES = {
+    'message': {
+        'id': 'i', 'content': 'c', 'sender_name': 'n', 'sender_id': 's', 'timestamp': 't',
+        'attachment': 'a', 'is_forward': 'f', 'room_type': 'r',
+        'filename': 'fn', 'is_image': 'im', 'viewed': 'v', 'preview': 'p',
+        'width': 'w', 'height': 'h', 'blurhash': 'b',
+    },
+    'unread_update': {'updates': 'u', 'room_id': 'r', 'count': 'n'},
+    'user_status_update': {'user_id': 'u', 'status': 's'},
+}
+
+
+def epoch_ms(timestamp):
+    """'2024-01-01T12:00:00.123456Z' -> milliseconds since the epoch."""
+    return int(datetime.fromisoformat(timestamp.rstrip('Z')).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def negotiate(auth):
+    """
+    Called from the connect handler with the client's Socket.IO auth payload.
+    Clients that send {'codec': 'compact'} get the short field codes on this
+    connection; anything else keeps the full JSON keys.
+    """
+    session['codec'] = COMPACT if isinstance(auth, dict) and auth.get('codec') == COMPACT else None
+
+
+def is_compact():
+    return session.get('codec') == COMPACT
+
+
+def variant(room, compact):
+    """The Socket.IO room carrying the compact form of `room`'s events."""
+    return f"{room}|c" if compact else room
+
+
+class Subscriptions:
+    """
+    Which variants of the realtime rooms local connections are in, by the
+    suffix those rooms carry: '' or '|c' for the user and presence rooms
+    (the codec negotiated at connect), and '|m', '|m|c' or '|b' for new
+    messages (see batching.message_kind). Publishers skip a variant no
+    connection uses, so a deployment without compact or batch clients
+    encodes and emits each event once. Behind a message queue the other
+    workers' connections are unknown, so every variant counts as used
+    (set once by init_app, before any local connection).
+    """
+
+    def __init__(self):
+        self.shared = False
+        self.skipped = 0
+        self._kinds = {}    # sid -> set of kinds
+        self._counts = {}   # kind -> connections
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.shared = bool(app.config['SOCKETIO_MESSAGE_QUEUE'])
+
+    def add(self, sid, kind):
+        with self._lock:
+            kinds = self._kinds.setdefault(sid, set())
+            if kind not in kinds:
+                kinds.add(kind)
+                self._counts[kind] = self._counts.get(kind, 0) + 1
+
+    def remove(self, sid):
+        with self._lock:
+            for kind in self._kinds.pop(sid, ()):
+                self._counts[kind] -= 1
+                if not self._counts[kind]:
+                    del self._counts[kind]
+
+    def used(self, kind):
+        if self.shared or kind in self._counts:
+            return True
+        self.skipped += 1
+        return False
+
+    def uses_codec(self, compact):
+        """Whether any connection negotiated the compact (or the full) codec."""
+        return self.used(variant('', compact))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': len(self._kinds),
+                'by_kind': {kind or 'full': n for kind, n in self._counts.items()},
+                'skipped_emits': self.skipped,
+            }
+
+
+subscriptions = Subscriptions()
+metrics.register('room_variants', subscriptions.stats)
+
+
+def _encode(value, codes):
+    if isinstance(value, dict):
+        return {codes.get(key, key): epoch_ms(item) if key == 'timestamp' else _encode(item, codes)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [_encode(item, codes) for item in value]
+    return value
+
+
+def encode(event, payload):
+    """`payload` with FIELD_CODES[event] keys, and timestamps as epoch milliseconds."""
+    return _encode(payload, FIELD_CODES[event])
+
+
+@bp.app_context_processor
+def _field_codes():
+    # base.html hands the table to the client-side decoder
+    return {'field_codes': FIELD_CODES}
@@ -0,0 +1,122 @@
+import threading
+from collections import namedtuple
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app import metrics
+from app.models import User, CacheVersion
+
+VERSION_NAME = 'users'
+
+
+class SocketUser(namedtuple('SocketUser', ['id', 'name'])):
+    """The connected user as Socket.IO handlers see it."""
+    __slots__ = ()
+    is_authenticated = True
+
+
+class SocketUsers:
+    """
+    (id, name) of the logged-in user behind every local Socket.IO
+    connection, taken once at connect. Event handlers identify the sender
+    from it instead of through current_user, which loads the User row again
+    for every event. Renames committed here update the snapshots after
+    commit; renames by other processes are caught by re-reading the shared
+    'users' stamp at most every `check_interval` seconds, and a moved stamp
+    reloads the names of the connected users in one query.
+    """
+
+    def __init__(self):
+        self.check_interval = 1.0
+        self.lookups = 0
+        self.version_checks = 0
+        self.remote_refreshes = 0
+        self.version = None
+        self.checked_at = 0.0
+        self._by_sid = {}
+        self._lock = threading.Lock()
+
+    def connect(self, sid, user):
+        self.check_interval = current_app.config['SOCKET_USER_CHECK_INTERVAL']
+        snapshot = SocketUser(user.id, user.name)
+        with self._lock:
+            self._by_sid[sid] = snapshot
+        return snapshot
+
+    def disconnect(self, sid):
+        with self._lock:
+            self._by_sid.pop(sid, None)
+
+    def get(self, sid):
+        """The snapshot for `sid`, or None if it did not connect logged in."""
+        self.check_version()
+        with self._lock:
+            self.lookups += 1
+            return self._by_sid.get(sid)
+
+    def rename(self, names):
+        """Applies {user_id: name} to every snapshot of those users."""
+        with self._lock:
+            for sid, snapshot in self._by_sid.items():
+                if snapshot.id in names:
+                    self._by_sid[sid] = snapshot._replace(name=names[snapshot.id])
+
+    def check_version(self):
+        if not CacheVersion.check(self, VERSION_NAME):
+            return
+        with self._lock:
+            user_ids = {snapshot.id for snapshot in self._by_sid.values()}
+        if user_ids:
+            self.remote_refreshes += 1
+            self.rename(dict(db.session.query(User.id, User.name).filter(User.id.in_(user_ids))))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': len(self._by_sid),
+                'lookups': self.lookups,
+                'version_checks': self.version_checks,
+                'remote_refreshes': self.remote_refreshes,
+            }
+
+
+socket_users = SocketUsers()
+metrics.register('socket_users', socket_users.stats)
+
+
+def socket_user():
+    """The user of the Socket.IO connection handling the current event, or None."""
+    return socket_users.get(request.sid)
+
+
+# --- Renames: bump the shared stamp inside the transaction, update the local
+# snapshots once it commits.
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, user):
+    if db.inspect(user).attrs.name.history.has_changes():
+        session = Session.object_session(user)
+        if session is not None:
+            session.info.setdefault('users_renamed', {})[user.id] = user.name
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_version(session, flush_context):
+    if session.info.get('users_renamed') and not session.info.get('users_bumped'):
+        CacheVersion.bump(session.connection(), VERSION_NAME)
+        session.info['users_bumped'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _rename_committed(session):
+    renamed = session.info.pop('users_renamed', None)
+    session.info.pop('users_bumped', None)
+    if renamed:
+        socket_users.rename(renamed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('users_renamed', None)
+    session.info.pop('users_bumped', None)
@@ -0,0 +1,143 @@
+from flask import current_app
+from sqlalchemy import select, and_, tuple_, event, inspect
+from app import db
+from app import metrics
+from app.cache import TTLCache
+from app.models import User, UserSearchToken, normalize_search_text
+
+
+def _prefix_range(column, prefix):
+    """column LIKE 'prefix%' written as a range, so any B-tree index can serve it."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+_cache = None
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        # Keystroke searches repeat the same short prefixes, so most never reach
+        # the database. The TTL lets users created by other workers show up;
+        # local changes clear the cache immediately.
+        _cache = TTLCache(
+            max_entries=current_app.config['USER_SEARCH_CACHE_SIZE'],
+            ttl=current_app.config['USER_SEARCH_CACHE_TTL']
+        )
+    return _cache
+
+
+metrics.register('user_search_cache', lambda: _cache.stats() if _cache is not None else {})
+
+
+def invalidate_user_search():
+    """Drops cached typeahead results, e.g. after a user registers or is renamed."""
+    if _cache is not None:
+        _cache.clear()
+
+
+@event.listens_for(User, 'after_insert')
+def _user_created(mapper, connection, user):
+    invalidate_user_search()
+
+
+@event.listens_for(User, 'after_update')
+def _user_changed(mapper, connection, user):
+    state = inspect(user)
+    if any(state.attrs[field].history.has_changes() for field in ('name', 'username', 'email', 'public_id', 'is_active')):
+        invalidate_user_search()
+
+
+def _lookup(words, limit):
+    # Drive the range scan with the most selective (longest) word;
+    # every other word must also prefix-match one of the user's tokens.
+    words = sorted(words, key=len, reverse=True)
+    query = db.session.query(UserSearchToken.user_id)\
+        .join(User, User.id == UserSearchToken.user_id)\
+        .filter(_prefix_range(UserSearchToken.token, words[0]), User.is_active == True)
+    for word in words[1:]:
+        query = query.filter(UserSearchToken.user_id.in_(
+            select(UserSearchToken.user_id).where(_prefix_range(UserSearchToken.token, word))
+        ))
+
+    # Walk the index in token order and stop early. Inactive users are
+    # filtered before the LIMIT, so they cannot crowd out active matches; a
+    # user can match on several tokens, so over-fetch a little before
+    # de-duplicating.
+    user_ids = []
+    for (user_id,) in query.order_by(UserSearchToken.token).limit(limit * 5):
+        if user_id not in user_ids:
+            user_ids.append(user_id)
+            if len(user_ids) == limit:
+                break
+
+    if not user_ids:
+        return []
+
+    rows = db.session.query(User.id, User.name, User.username, User.email, User.public_id)\
+        .filter(User.id.in_(user_ids), User.is_active == True).all()
+    return sorted(
+        ({'id': r.id, 'name': r.name, 'username': r.username, 'email': r.email, 'public_id': r.public_id} for r in rows),
+        key=lambda u: (u['name'].lower(), u['id'])
+    )
+
+
+def search_users(search_query, exclude_user_id=None, limit=None):
+    """
+    Returns up to `limit` active users whose name, username, email or public ID
+    has a word starting with each word of the query, as lightweight dicts.
+    """
+    max_limit = current_app.config['USER_SEARCH_LIMIT']
+    limit = max(1, min(limit or max_limit, max_limit))
+    # Whitespace separates words; '@' and '.' stay so emails match as typed
+    words = [w[:100] for w in normalize_search_text(search_query).split()]
+    if not words:
+        return []
+
+    # Cache on the query alone (one spare row covers the excluded user)
+    cache = _get_cache()
+    key = (' '.join(words), max_limit + 1)
+    results = cache.get(key)
+    if results is None:
+        results = _lookup(words, max_limit + 1)
+        cache.put(key, results)
+
+    return [u for u in results if u['id'] != exclude_user_id][:limit]
+
+
+def member_choices(user_ids, exclude_user_id):
+    """
+    (id, name) pairs for the submitted IDs that may join a group, fetched with
+    one bounded IN query. IDs past GROUP_MAX_MEMBERS are dropped, so they fail
+    form validation instead of growing the query.
+    """
+    user_ids = list(dict.fromkeys(user_ids))[:current_app.config['GROUP_MAX_MEMBERS']]
+    if not user_ids:
+        return []
+    rows = db.session.query(User.id, User.name)\
+        .filter(User.id.in_(user_ids), User.is_active == True, User.id != exclude_user_id)\
+        .order_by(User.name, User.id).all()
+    return [(r.id, r.name) for r in rows]
+
+
+def list_member_candidates(exclude_user_id, after_id=None, limit=None):
+    """
+    One page of active users as (id, name), ordered by name and keyed on the
+    last ID the client has. Returns (rows, next_cursor).
+    """
+    page_size = current_app.config['MEMBER_PICKER_PAGE_SIZE']
+    limit = max(1, min(limit or page_size, page_size))
+
+    query = db.session.query(User.id, User.name)\
+        .filter(User.is_active == True, User.id != exclude_user_id)
+
+    if after_id is not None:
+        cursor = db.session.query(User.name).filter(User.id == after_id).first()
+        if cursor is None:
+            return [], None
+        query = query.filter(tuple_(User.name, User.id) > (cursor.name, after_id))
+
+    rows = query.order_by(User.name, User.id).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [{'id': r.id, 'name': r.name} for r in rows[:limit]], next_cursor
@@ -0,0 +1,56 @@
+import mimetypes
+from urllib.parse import quote
+from flask import current_app, send_file, Response
+from sqlalchemy import and_
+from app import db
+from app.models import ChatMessage, ChatMessageAttachment, ChatParticipant
+from app.chat.storage import disk_path
+
+
+def load_attachment(attachment_id, user_id):
+    """
+    Everything the download route needs in one query: the attachment, its
+    message's room and sender, and whether `user_id` is in that room
+    (`participant_id` is None if not). None if there is no such attachment.
+    """
+    return db.session.query(
+        ChatMessageAttachment,
+        ChatMessage.room_id,
+        ChatMessage.sender_id,
+        ChatParticipant.id.label('participant_id')
+    ).join(
+        ChatMessage, ChatMessage.id == ChatMessageAttachment.message_id
+    ).outerjoin(
+        ChatParticipant, and_(ChatParticipant.room_id == ChatMessage.room_id, ChatParticipant.user_id == user_id)
+    ).filter(ChatMessageAttachment.id == attachment_id).first()
+
+
+def is_offloaded():
+    """True when the front server, not this worker, reads the file."""
+    return bool(current_app.config['ATTACHMENT_ACCEL_PREFIX'] or current_app.config['USE_X_SENDFILE'])
+
+
+def attachment_response(attachment, conditional=True):
+    """
+    Download response for an attachment file. `conditional=False` (a
+    view-once download) ignores Range and conditional headers and always
+    answers 200 with the whole file.
+
+    With ATTACHMENT_ACCEL_PREFIX, an empty response carrying X-Accel-Redirect
+    so nginx sends the bytes (and answers Range/conditional requests) from
+    its internal location. Otherwise send_file answers Range, If-None-Match
+    and If-Modified-Since itself, with the content hash as a strong ETag;
+    its body goes out through the server's wsgi.file_wrapper (sendfile()
+    under gunicorn), or as Flask's X-Sendfile header with USE_X_SENDFILE.
+    """
+    prefix = current_app.config['ATTACHMENT_ACCEL_PREFIX']
+    if prefix:
+        response = Response(mimetype=mimetypes.guess_type(attachment.filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(attachment.file_path)
+        response.headers.set('Content-Disposition', 'attachment', filename=attachment.filename)
+    else:
+        response = send_file(disk_path(attachment.file_path), as_attachment=True,
+                             download_name=attachment.filename, conditional=conditional,
+                             etag=attachment.blob_sha256 or True)
+    response.cache_control.private = True
+    return response
@@ -0,0 +1,134 @@
+from flask import current_app
+from sqlalchemy import and_, insert
+from sqlalchemy.orm import contains_eager
+from app import db
+from app.models import ChatRoom, ChatMessage, ChatMessageAttachment, ChatParticipant
+from app.chat.history import is_image_file
+from app.chat.storage import adopt, add_ref
+from app.chat.previews import request_preview, preview_info
+
+
+class ForwardError(Exception):
+    """A forward request that cannot be carried out; the message is shown to the user."""
+
+
+def _joined_rooms(user_id, room_ids):
+    return db.session.query(ChatRoom).join(
+        ChatParticipant, and_(ChatParticipant.room_id == ChatRoom.id, ChatParticipant.user_id == user_id)
+    ).filter(ChatRoom.id.in_(room_ids)).order_by(ChatRoom.id).all()
+
+
+def forward_messages(sender, message_ids, destination_room_ids):
+    """
+    Copies messages into one or more rooms in a single transaction.
+
+    - One query loads the selected messages with their attachments, limited
+      to rooms the sender is in (others are skipped), and one query checks
+      the destinations.
+    - Messages and attachments go in as two bulk INSERTs; attachments point
+      at the original blobs and take their references per blob, not per row.
+    - Each destination gets one activity bump and one unread bump.
+
+    Commits, and returns ({room_id: [message payloads]}, {room_id: unread rows})
+    for the caller to broadcast.
+    """
+    message_ids = {int(i) for i in message_ids}
+    destination_room_ids = {int(i) for i in destination_room_ids}
+    if not message_ids or not destination_room_ids:
+        raise ForwardError('Missing message IDs or room ID.')
+    if len(message_ids) > current_app.config['FORWARD_MAX_MESSAGES']:
+        raise ForwardError(f"You can forward at most {current_app.config['FORWARD_MAX_MESSAGES']} messages at once.")
+    if len(destination_room_ids) > current_app.config['FORWARD_MAX_ROOMS']:
+        raise ForwardError(f"You can forward to at most {current_app.config['FORWARD_MAX_ROOMS']} chats at once.")
+
+    destinations = _joined_rooms(sender.id, destination_room_ids)
+    if len(destinations) != len(destination_room_ids):
+        raise ForwardError('Unauthorized to send to this room.')
+
+    sources = ChatMessage.query.join(
+        ChatParticipant, and_(ChatParticipant.room_id == ChatMessage.room_id, ChatParticipant.user_id == sender.id)
+    ).outerjoin(ChatMessage.attachment).options(
+        contains_eager(ChatMessage.attachment)
+    ).filter(ChatMessage.id.in_(message_ids)).order_by(ChatMessage.timestamp.asc(), ChatMessage.id.asc()).all()
+    if not sources:
+        return {}, {}
+
+    # Resolve each source attachment to a stored blob once, however many destinations
+    available = {msg.id: adopt(msg.attachment) for msg in sources if msg.attachment is not None}
+    db.session.flush()
+
+    # 1. Messages, one row per (destination, source), in one INSERT
+    message_rows = []
+    for room in destinations:
+        for msg in sources:
+            content = f"[Forwarded]: {msg.content}"
+            if msg.attachment is not None and not available[msg.id]:
+                content += " (Original attachment was missing)"
+            message_rows.append({'sender_id': sender.id, 'room_id': room.id, 'content': content})
+    new_messages = db.session.scalars(
+        insert(ChatMessage).returning(ChatMessage, sort_by_parameter_order=True), message_rows
+    ).all()
+
+    # 2. Attachments sharing the originals' blobs, in one INSERT
+    attachment_rows, refs = [], {}
+    for new_msg, msg in zip(new_messages, sources * len(destinations)):
+        attachment = msg.attachment
+        if attachment is None or not available[msg.id]:
+            continue
+        attachment_rows.append({
+            'message_id': new_msg.id,
+            'filename': attachment.filename,
+            'file_path': attachment.file_path,
+            'file_size_bytes': attachment.file_size_bytes,
+            'blob_sha256': attachment.blob_sha256
+        })
+        n, _ = refs.get(attachment.blob_sha256, (0, attachment.file_size_bytes))
+        refs[attachment.blob_sha256] = (n + 1, attachment.file_size_bytes)
+    new_attachments = {}
+    if attachment_rows:
+        for new_attachment in db.session.scalars(
+            insert(ChatMessageAttachment).returning(ChatMessageAttachment, sort_by_parameter_order=True),
+            attachment_rows
+        ):
+            new_attachments[new_attachment.message_id] = new_attachment
+        connection = db.session.connection()
+        for sha256, (n, size) in refs.items():
+            add_ref(connection, sha256, size, n)
+        previewed = set()
+        for new_attachment in new_attachments.values():
+            if new_attachment.blob_sha256 not in previewed:
+                previewed.add(new_attachment.blob_sha256)
+                request_preview(new_attachment)
+
+    # 3. One activity and unread bump per destination
+    per_room = len(sources)
+    unread = {}
+    for i, room in enumerate(destinations):
+        ChatRoom.record_activity(room.id, new_messages[(i + 1) * per_room - 1])
+        unread[room.id] = ChatParticipant.bump_unread(room.id, sender.id, per_room)
+
+    db.session.commit()
+
+    payloads = {}
+    for i, room in enumerate(destinations):
+        payloads[room.id] = []
+        for new_msg in new_messages[i * per_room:(i + 1) * per_room]:
+            new_attachment = new_attachments.get(new_msg.id)
+            payloads[room.id].append({
+                'id': new_msg.id,
+                'room_id': room.id,
+                'content': new_msg.content,
+                'sender_name': sender.name,
+                'sender_id': sender.id,
+                'timestamp': new_msg.timestamp.isoformat() + 'Z',
+                'attachment': {
+                    'id': new_attachment.id,
+                    'filename': new_attachment.filename,
+                    'is_image': is_image_file(new_attachment.filename),
+                    'viewed': False,
+                    'preview': preview_info(new_attachment)
+                } if new_attachment else None,
+                'room_type': room.room_type,
+                'is_forward': True
+            })
+    return payloads, unread
@@ -0,0 +1,71 @@
+from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.models import ChatMessage, ChatMessageAttachment
+from app.chat.previews import preview_info
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg')
+
+
+def is_image_file(filename):
+    """True if the filename looks like an image the browser can preview."""
+    return (filename or '').lower().endswith(IMAGE_EXTENSIONS)
+
+
+def serialize_message(msg, room_type=None):
+    """Builds the same payload the socket handlers broadcast for a new message."""
+    attachment = msg.attachment
+    return {
+        'id': msg.id,
+        'content': msg.content,
+        'sender_name': msg.sender.name,
+        'sender_id': msg.sender_id,
+        'room_id': msg.room_id,
+        'timestamp': msg.timestamp.isoformat() + 'Z',
+        'attachment': {
+            'id': attachment.id,
+            'filename': attachment.filename,
+            'is_image': is_image_file(attachment.filename),
+            'viewed': attachment.viewed,
+            'preview': preview_info(attachment)
+        } if attachment else None,
+        'room_type': room_type,
+        'is_forward': (msg.content or '').startswith('[Forwarded]')
+    }
+
+
+def get_message_page(room_id, before_id=None, limit=None):
+    """
+    Returns one page of a room's history, oldest first, plus a has_more flag.
+
+    Pages are keyed on (room_id, id): `before_id` is the oldest message the
+    client already has. Rows are walked newest-first on the
+    (room_id, timestamp, id) index, so every page is a single range scan no
+    matter how long the room's history is.
+    """
+    page_size = current_app.config['MESSAGES_PAGE_SIZE']
+    limit = max(1, min(limit or page_size, current_app.config['MESSAGES_PAGE_SIZE_MAX']))
+
+    query = ChatMessage.query.filter(ChatMessage.room_id == room_id)
+
+    if before_id is not None:
+        cursor = db.session.query(ChatMessage.timestamp).filter(
+            ChatMessage.id == before_id,
+            ChatMessage.room_id == room_id
+        ).first()
+        if cursor is None:
+            return [], False
+        query = query.filter(tuple_(ChatMessage.timestamp, ChatMessage.id) < (cursor.timestamp, before_id))
+
+    # Fetch one extra row to know whether an older page exists
+    rows = query.options(
+        joinedload(ChatMessage.sender),
+        selectinload(ChatMessage.attachment).joinedload(ChatMessageAttachment.blob)
+    ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
@@ -0,0 +1,141 @@
+import time
+from flask import current_app
+from app import db, socketio
+from app import metrics
+from app.models import ChatRoom, ChatMessage, ChatParticipant
+from app.chat.unread import unread_notifier
+from app.chat.batching import message_batcher
+
+
+class MessageIngestor:
+    """
+    Write-behind path for `send_message`. Handlers only queue the message; one
+    background task drains the queue in batches (up to `batch_size` messages
+    or `max_delay` seconds after the first) and writes each batch in a single
+    transaction, so concurrent senders share one commit instead of queueing
+    on one fsync each. A batch is broadcast only after its commit, in queue
+    order, which keeps per-room ordering.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.batches = 0
+        self.failed = 0
+        self._queue = None
+        self._empty = None
+        self._task = None
+        self._app = None
+
+    def submit(self, room_id, sender_id, sender_name, content, sid):
+        if self._task is None:
+            self._app = current_app._get_current_object()
+            eio = socketio.server.eio
+            self._queue = eio.create_queue()
+            self._empty = eio.get_queue_empty_exception()
+            self._task = socketio.start_background_task(
+                self._run,
+                current_app.config['MESSAGE_INGEST_BATCH_SIZE'],
+                current_app.config['MESSAGE_INGEST_MAX_DELAY_MS'] / 1000.0
+            )
+        self._queue.put({
+            'room_id': room_id, 'sender_id': sender_id, 'sender_name': sender_name,
+            'content': content, 'sid': sid
+        })
+
+    def _run(self, batch_size, max_delay):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + max_delay
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except self._empty:
+                    break
+            try:
+                with self._app.app_context():
+                    self.write_batch(batch)
+            except Exception:
+                # Keep draining; a broadcast error must not stop the ingest task
+                self._app.logger.exception("Error in message ingest loop")
+
+    def write_batch(self, batch):
+        """
+        Inserts, commits, then broadcasts one batch. Needs an app context. If
+        the batch commit fails, each message is retried in its own
+        transaction so only the ones that fail again are dropped.
+        """
+        try:
+            written, unread = self._commit(batch)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error writing message batch, retrying one by one: {e}")
+            written, unread = [], {}
+            for item in batch:
+                try:
+                    rows, item_unread = self._commit([item])
+                except Exception as e:
+                    db.session.rollback()
+                    self.failed += 1
+                    current_app.logger.error(f"Error writing message: {e}")
+                    socketio.emit('error', {'message': 'Your message could not be sent.'}, to=item['sid'])
+                    continue
+                written.extend(rows)
+                for room_id, counts in item_unread.items():
+                    # Later commits only raise the counts, so newer rows win
+                    unread.setdefault(room_id, {}).update(counts)
+
+        self.batches += 1
+        self.messages += len(written)
+
+        # 3. Broadcast in queue order
+        for item, msg in written:
+            message_batcher.publish(msg.room_id, {
+                'id': msg.id,
+                'content': msg.content,
+                'sender_name': item['sender_name'],
+                'sender_id': msg.sender_id,
+                'timestamp': msg.timestamp.isoformat() + 'Z',
+                'attachment': None,
+                'is_forward': False
+            })
+        for room_id, rows in unread.items():
+            unread_notifier.add(room_id, rows.items())
+
+    def _commit(self, items):
+        """Writes `items` in one transaction; returns [(item, message)] and the unread rows per room."""
+        messages = [ChatMessage(sender_id=item['sender_id'], room_id=item['room_id'], content=item['content'])
+                    for item in items]
+        db.session.add_all(messages)
+        db.session.flush()
+
+        # 1. One activity bump per room and one unread bump per (room, sender)
+        last_in_room, sent_by = {}, {}
+        for msg in messages:
+            last_in_room[msg.room_id] = msg
+            key = (msg.room_id, msg.sender_id)
+            sent_by[key] = sent_by.get(key, 0) + 1
+        for room_id, msg in last_in_room.items():
+            ChatRoom.record_activity(room_id, msg)
+        unread = {}
+        for (room_id, sender_id), n in sent_by.items():
+            # Counts only grow inside the transaction, so the last row per user is the final count
+            unread.setdefault(room_id, {}).update(ChatParticipant.bump_unread(room_id, sender_id, n))
+
+        # 2. COMMIT the whole batch once
+        db.session.commit()
+        return list(zip(items, messages)), unread
+
+    def stats(self):
+        return {
+            'messages': self.messages,
+            'batches': self.batches,
+            'failed': self.failed,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+message_ingestor = MessageIngestor()
+metrics.register('message_ingest', message_ingestor.stats)
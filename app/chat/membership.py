@@ -0,0 +1,126 @@
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app import metrics
+from app.cache import TTLCache
+from app.models import ChatRoom, ChatParticipant, CacheVersion
+
+VERSION_NAME = 'membership'
+
+
+class MembershipCache(TTLCache):
+    """
+    room ID -> frozenset of member user IDs, for authorization on the hot
+    paths (send, upload, download, forward). Local membership changes drop
+    the room after commit. Changes made by other processes are caught by
+    re-reading the shared 'membership' stamp at most every `check_interval`
+    seconds (0 = on every lookup); a moved stamp clears the whole cache.
+    """
+
+    def __init__(self, max_entries, ttl, check_interval):
+        super().__init__(max_entries=max_entries, ttl=ttl)
+        self.check_interval = check_interval
+        self.version = None
+        self.version_checks = 0
+        self.remote_invalidations = 0
+        self.checked_at = 0.0
+
+    def check_version(self):
+        if CacheVersion.check(self, VERSION_NAME):
+            self.remote_invalidations += 1
+            self.clear()
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(version_checks=self.version_checks, remote_invalidations=self.remote_invalidations)
+        return stats
+
+
+_cache = None
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = MembershipCache(
+            max_entries=current_app.config['MEMBERSHIP_CACHE_SIZE'],
+            ttl=current_app.config['MEMBERSHIP_CACHE_TTL'],
+            check_interval=current_app.config['MEMBERSHIP_VERSION_CHECK_INTERVAL']
+        )
+    return _cache
+
+
+metrics.register('membership_cache', lambda: _cache.stats() if _cache is not None else {})
+
+
+def room_members(room_id):
+    """frozenset of user IDs in the room (empty if it does not exist)."""
+    cache = _get_cache()
+    cache.check_version()
+    members = cache.get(room_id)
+    if members is None:
+        members = frozenset(
+            user_id for (user_id,) in db.session.query(ChatParticipant.user_id).filter_by(room_id=room_id)
+        )
+        cache.put(room_id, members)
+    return members
+
+
+def is_member(room_id, user_id):
+    try:
+        room_id = int(room_id)
+    except (TypeError, ValueError):
+        return False
+    return user_id in room_members(room_id)
+
+
+# --- Invalidation: any flush that adds or removes members bumps the shared
+# stamp inside that transaction; the local entries go once it commits.
+
+def _changed(target, room_id):
+    session = Session.object_session(target)
+    if session is not None and room_id is not None:
+        session.info.setdefault('membership_changed', set()).add(room_id)
+
+
+@event.listens_for(ChatParticipant, 'after_insert')
+@event.listens_for(ChatParticipant, 'after_delete')
+def _participant_changed(mapper, connection, participant):
+    _changed(participant, participant.room_id)
+
+
+@event.listens_for(ChatParticipant, 'after_update')
+def _participant_moved(mapper, connection, participant):
+    state = db.inspect(participant)
+    if state.attrs.room_id.history.has_changes() or state.attrs.user_id.history.has_changes():
+        for room_id in {participant.room_id, *state.attrs.room_id.history.deleted}:
+            _changed(participant, room_id)
+
+
+@event.listens_for(ChatRoom, 'after_delete')
+def _room_deleted(mapper, connection, room):
+    _changed(room, room.id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_version(session, flush_context):
+    changed = session.info.get('membership_changed')
+    if changed and not session.info.get('membership_bumped'):
+        CacheVersion.bump(session.connection(), VERSION_NAME)
+        session.info['membership_bumped'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_committed(session):
+    changed = session.info.pop('membership_changed', None)
+    session.info.pop('membership_bumped', None)
+    if changed and _cache is not None:
+        for room_id in changed:
+            _cache.discard(room_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('membership_changed', None)
+    session.info.pop('membership_bumped', None)
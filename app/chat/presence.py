@@ -0,0 +1,179 @@
+import time
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from flask import current_app
+from app import db, socketio
+from app import metrics
+from app.models import User
+from app.chat import codec
+
+
+def to_ist_str(dt):
+    """
+    Converts a naive UTC datetime from the DB to an IST string for display.
+    """
+    if dt is None:
+        return None
+    # Tell the naive datetime it is in UTC
+    dt_aware = dt.replace(tzinfo=timezone.utc)
+    # Convert to Asia/Kolkata and format
+    return dt_aware.astimezone(ZoneInfo("Asia/Kolkata")).strftime('%I:%M %p')
+
+
+def presence_room(user_id):
+    """Socket.IO room of the sockets that display this user's status."""
+    return f"presence_{user_id}"
+
+
+class PresenceRegistry:
+    """
+    Who is connected to this worker, without touching the database per socket.
+
+    - Connections are refcounted per user, so extra tabs and reconnects do
+      not produce status changes.
+    - When the last connection goes, the user is only marked offline after
+      `grace` seconds. A reconnect inside that window (page navigation,
+      flaky network) cancels it and nobody is notified.
+    - Sockets that stop sending heartbeats for `timeout` seconds are dropped.
+    - last_seen is written in one batched UPDATE every `flush_interval`
+      seconds: connected users get "now", departed users their leave time.
+    - Status changes go to presence_<user_id>, which only the sockets that
+      have a 1:1 room with that user open are subscribed to.
+    """
+
+    def __init__(self):
+        self.grace = 5.0
+        self.timeout = 75.0
+        self.flush_interval = 30.0
+        self.status_emits = 0
+        self.flaps_suppressed = 0
+        self.expired_sockets = 0
+        self.last_seen_rows = 0
+        self._sockets = {}        # user_id -> {sid: last heartbeat (monotonic)}
+        self._going_offline = {}  # user_id -> (deadline (monotonic), left at (utc))
+        self._last_seen = {}      # user_id -> utc datetime waiting to be flushed
+        self._lock = threading.Lock()
+        self._task = None
+        self._app = None
+
+    def _start(self):
+        if self._task is None:
+            config = current_app.config
+            self.grace = config['PRESENCE_OFFLINE_GRACE']
+            self.timeout = config['PRESENCE_TIMEOUT']
+            self.flush_interval = config['PRESENCE_FLUSH_INTERVAL']
+            self._app = current_app._get_current_object()
+            self._task = socketio.start_background_task(self._run)
+
+    def connect(self, user_id, sid):
+        with self._lock:
+            self._start()
+            was_online = user_id in self._sockets or user_id in self._going_offline
+            self._sockets.setdefault(user_id, {})[sid] = time.monotonic()
+            if self._going_offline.pop(user_id, None) is not None:
+                self.flaps_suppressed += 1
+        if not was_online:
+            self._emit_status(user_id, 'Online')
+
+    def heartbeat(self, sid, user_id):
+        with self._lock:
+            sockets = self._sockets.get(user_id)
+            if sockets is not None and sid in sockets:
+                sockets[sid] = time.monotonic()
+
+    def disconnect(self, user_id, sid):
+        with self._lock:
+            self._remove(user_id, sid)
+
+    def _remove(self, user_id, sid):
+        sockets = self._sockets.get(user_id)
+        if sockets is None or sockets.pop(sid, None) is None:
+            return
+        if not sockets:
+            del self._sockets[user_id]
+            self._going_offline[user_id] = (time.monotonic() + self.grace, datetime.utcnow())
+
+    def is_online(self, user_id):
+        with self._lock:
+            return user_id in self._sockets or user_id in self._going_offline
+
+    def _emit_status(self, user_id, status):
+        self.status_emits += 1
+        payload = {'user_id': user_id, 'status': status}
+        if codec.subscriptions.uses_codec(compact=False):
+            socketio.emit('user_status_update', payload, to=presence_room(user_id))
+        if codec.subscriptions.uses_codec(compact=True):
+            socketio.emit('user_status_update', codec.encode('user_status_update', payload),
+                          to=codec.variant(presence_room(user_id), True))
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            socketio.sleep(1)
+            try:
+                self._tick()
+                if time.monotonic() >= next_flush:
+                    next_flush = time.monotonic() + self.flush_interval
+                    with self._app.app_context():
+                        self.flush()
+            except Exception as e:
+                self._app.logger.error(f"Error in presence loop: {e}")
+
+    def _tick(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = [(user_id, sid) for user_id, sockets in self._sockets.items()
+                     for sid, seen in sockets.items() if now - seen > self.timeout]
+            for user_id, sid in stale:
+                self._remove(user_id, sid)
+            self.expired_sockets += len(stale)
+
+            gone = [(user_id, left_at) for user_id, (deadline, left_at) in self._going_offline.items()
+                    if deadline <= now]
+            for user_id, left_at in gone:
+                del self._going_offline[user_id]
+                self._last_seen[user_id] = left_at
+
+        for user_id, sid in stale:
+            socketio.server.disconnect(sid, namespace='/')
+        for user_id, left_at in gone:
+            self._emit_status(user_id, f"Last seen at {to_ist_str(left_at)}")
+
+    def flush(self):
+        """Writes pending last_seen values in one statement. Needs an app context."""
+        now = datetime.utcnow()
+        with self._lock:
+            pending, self._last_seen = self._last_seen, {}
+            for user_id in self._sockets:
+                pending[user_id] = now
+        if not pending:
+            return
+        try:
+            db.session.execute(db.update(User), [
+                {'id': user_id, 'last_seen': last_seen} for user_id, last_seen in pending.items()
+            ])
+            db.session.commit()
+            self.last_seen_rows += len(pending)
+        except Exception:
+            db.session.rollback()
+            # Keep the values for the next flush unless something newer arrived
+            with self._lock:
+                for user_id, last_seen in pending.items():
+                    self._last_seen.setdefault(user_id, last_seen)
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'online_users': len(self._sockets) + len(self._going_offline),
+                'sockets': sum(len(sockets) for sockets in self._sockets.values()),
+                'status_emits': self.status_emits,
+                'flaps_suppressed': self.flaps_suppressed,
+                'expired_sockets': self.expired_sockets,
+                'last_seen_rows': self.last_seen_rows,
+            }
+
+
+presence = PresenceRegistry()
+metrics.register('presence', presence.stats)
@@ -0,0 +1,220 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, send_file, abort
+from app import db, socketio
+from app import jobs
+from app import metrics
+from app.models import AttachmentBlob, ChatMessageAttachment
+from app.chat.storage import blob_path, derivative_path, disk_path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it attachments just get no preview
+    Image = None
+
+# Formats Pillow can decode; SVGs are shown as they are
+RASTER_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+_stats = {'rendered': 0, 'failed': 0, 'reused': 0}
+
+metrics.register('attachment_previews', lambda: dict(_stats))
+
+
+# --- Rendering; runs in the preview process pool, so only plain arguments
+
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _base83(value, length):
+    return ''.join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(pixels, width, height, x_components=4, y_components=3):
+    """BlurHash (https://blurha.sh) of `pixels`, a row-major list of RGB tuples."""
+    linear = [(_to_linear(r), _to_linear(g), _to_linear(b)) for r, g, b in pixels]
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            norm = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                cos_y = math.cos(math.pi * j * y / height)
+                row = y * width
+                for x in range(width):
+                    basis = norm * math.cos(math.pi * i * x / width) * cos_y
+                    lr, lg, lb = linear[row + x]
+                    r += basis * lr
+                    g += basis * lg
+                    b += basis * lb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(c) for f in ac for c in f) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+    for f in ac:
+        q = [max(0, min(18, int(math.floor(math.copysign(abs(c / max_value) ** 0.5, c) * 9 + 9.5)))) for c in f]
+        result += _base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
+
+
+def render_preview(src_path, dest_path, max_size, max_pixels):
+    """
+    Writes a JPEG thumbnail of at most max_size x max_size to dest_path and
+    returns (width, height, blurhash). Raises for anything Pillow cannot read
+    or larger than max_pixels (decompression bombs).
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(src_path) as image:
+        # JPEGs decode straight at a fraction of their size
+        image.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        else:
+            image = image.convert('RGB')
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        partial = dest_path + '.part'
+        image.save(partial, 'JPEG', quality=80, optimize=True)
+        os.replace(partial, dest_path)
+
+        small = image.copy()
+        small.thumbnail((32, 32))
+        data = small.tobytes()
+        pixels = [tuple(data[i:i + 3]) for i in range(0, len(data), 3)]
+        return image.width, image.height, blurhash(pixels, small.width, small.height)
+
+
+# --- Scheduling
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the children must not inherit the event loop
+        _pool = ProcessPoolExecutor(max_workers=current_app.config['PREVIEW_WORKERS'],
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def shutdown():
+    """
+    Stops the preview processes. Servers call it on the way out (gunicorn's
+    worker_exit hook, run.py): under eventlet the pool's manager thread
+    cannot be joined once the interpreter is exiting, so a pool left open
+    would hang the shutdown.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+
+def enabled():
+    return Image is not None and current_app.config['PREVIEW_MAX_SIZE'] > 0
+
+
+def preview_info(attachment):
+    """Preview fields for an attachment payload, or None while there is none."""
+    blob = attachment.blob if attachment.blob_sha256 else None
+    if blob is None or blob.preview_status != 'ready':
+        return None
+    return {'width': blob.preview_width, 'height': blob.preview_height, 'blurhash': blob.blurhash}
+
+
+def request_preview(attachment):
+    """
+    Queues a preview for an image attachment in the caller's transaction,
+    unless its blob already has one (forwards and re-uploads share it).
+    """
+    if not enabled() or not attachment.blob_sha256:
+        return
+    if not (attachment.filename or '').lower().endswith(RASTER_EXTENSIONS):
+        return
+    blob = attachment.blob
+    if blob is not None and blob.preview_status is not None:
+        return
+    jobs.enqueue('attachments.preview', attachment_id=attachment.id, sha256=attachment.blob_sha256)
+
+
+@jobs.task('attachments.preview', max_attempts=2)
+def make_preview(attachment_id, sha256):
+    """Renders the blob's thumbnail in the process pool, then tells the attachment's room."""
+    blob = db.session.get(AttachmentBlob, sha256)
+    if blob is None:
+        return
+    if blob.preview_status is None:
+        future = _get_pool().submit(
+            render_preview,
+            disk_path(blob_path(sha256)),
+            disk_path(derivative_path(sha256)),
+            current_app.config['PREVIEW_MAX_SIZE'],
+            current_app.config['PREVIEW_MAX_PIXELS']
+        )
+        # Wait without blocking the other green threads
+        while not future.done():
+            socketio.sleep(0.02)
+        try:
+            blob.preview_width, blob.preview_height, blob.blurhash = future.result()
+            blob.preview_status = 'ready'
+            _stats['rendered'] += 1
+        except Exception as e:
+            current_app.logger.warning(f"No preview for blob {sha256}: {e}")
+            blob.preview_status = 'failed'
+            _stats['failed'] += 1
+        db.session.commit()
+    else:
+        _stats['reused'] += 1
+
+    attachment = db.session.get(ChatMessageAttachment, attachment_id)
+    preview = preview_info(attachment) if attachment is not None else None
+    if preview:
+        socketio.emit('attachment_preview', {
+            'attachment_id': attachment.id,
+            'message_id': attachment.message_id,
+            'preview': preview
+        }, to=str(attachment.message.room_id))
+
+
+def thumbnail_response(attachment):
+    """
+    The thumbnail, cacheable by the browser for a long time since an
+    attachment's content never changes. Unlike the original, fetching it
+    does not count as a view.
+    """
+    if preview_info(attachment) is None:
+        abort(404)
+    response = send_file(disk_path(derivative_path(attachment.blob_sha256)), mimetype='image/jpeg',
+                         conditional=True, etag=f"{attachment.blob_sha256}-thumb",
+                         max_age=current_app.config['PREVIEW_CACHE_MAX_AGE'])
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
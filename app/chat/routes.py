@@ -1,90 +1,95 @@
-import threading
-from datetime import datetime, timedelta, timezone
-from flask import render_template, request, redirect, url_for, flash, current_app, send_from_directory
+from datetime import datetime, timedelta
+from flask import render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from app import socketio, db
-from flask_socketio import emit, join_room, leave_room, send
+from flask_socketio import emit, join_room, leave_room
 from app.chat import bp
-from app.models import User, ChatRoom, ChatMessage, ChatMessageAttachment, ChatParticipant
-from sqlalchemy import or_, and_
+from app.models import User, ChatRoom, ChatMessage, ChatParticipant, PendingUpload
+from sqlalchemy import and_
+from sqlalchemy.orm.attributes import set_committed_value
 from app.forms import CreateGroupForm, MessageForm
+from app.chat.history import get_message_page, serialize_message
+from app.chat.sidebar import load_sidebar
+from app.chat.search import search_messages
+from app.chat.directory import search_users, member_choices, list_member_candidates
+from app.chat.unread import unread_notifier
+from app.chat.ingest import message_ingestor
+from app.chat.batching import message_batcher, message_room, message_kind
+from app.chat import codec
+from app.chat.connections import socket_users, socket_user
+from app import metrics
+from app import jobs
+from app.db_routing import read_replica
+from app.chat.membership import is_member, room_members
+from app.chat.presence import presence, presence_room, to_ist_str
+from app.chat.typing import typing_tracker
+from app.chat.uploads import (UploadError, begin_upload, append_chunk, received_bytes, finish_upload,
+                              cancel_upload, publish_attachment, partial_path)
+from app.chat.storage import store, disk_path
+from app.chat.downloads import load_attachment, attachment_response, is_offloaded
+from app.chat import cleanup  # registers the attachment and room jobs
+from app.chat.previews import thumbnail_response
+from app.chat.forwarding import forward_messages, ForwardError
 from werkzeug.utils import secure_filename
+import hmac
 import os
-import shutil
-from zoneinfo import ZoneInfo
+import uuid
 
 
-def to_ist_str(dt):
-    """
-    Converts a naive UTC datetime from the DB to an IST string for display.
-    """
-    if dt is None:
-        return None
-    # Tell the naive datetime it is in UTC
-    dt_aware = dt.replace(tzinfo=timezone.utc)
-    # Convert to Asia/Kolkata and format
-    return dt_aware.astimezone(ZoneInfo("Asia/Kolkata")).strftime('%I:%M %p')
-
 @bp.route('/')
+@read_replica
 @login_required
 def index():
     """Main chat interface page with user search and recent chats."""
     search_query = request.args.get('q', '')
-    search_term = f"%{search_query}%"
 
     # 1. Fetching USERS (User Directory)
-    users_query = User.query.filter(
-        User.id != current_user.id,
-        User.is_active == True
-    )
-    if search_query:
-        users_query = users_query.filter(
-            or_(
-                User.name.ilike(search_term),
-                User.email.ilike(search_term),
-                User.username.ilike(search_term),
-                User.public_id.ilike(search_term)
-            )
-        )
-    else:
-        # Don't list all users in a public system by default
-        users_query = users_query.filter(db.false())
+    # Don't list all users in a public system by default
+    users = search_users(search_query, exclude_user_id=current_user.id) if search_query else []
 
-    users = users_query.order_by(User.name).all()
-
-    # 2. Fetching PARTICIPATIONS (Recent Chats)
-    participations_query = ChatParticipant.query.filter_by(user_id=current_user.id)
-
-    if search_query:
-        all_participations = participations_query.all()
-        filtered_participations = []
-
-        for p in all_participations:
-            room = p.room
-            is_match = False
-
-            if room.room_type == 'group' and search_query.lower() in (room.name or '').lower():
-                is_match = True
-
-            if room.room_type == 'one_to_one':
-                other_user = next((part.user for part in room.participants if part.user_id != current_user.id), None)
-                if other_user and (search_query.lower() in other_user.name.lower() or search_query.lower() in other_user.email.lower()):
-                    is_match = True
-
-            if is_match:
-                filtered_participations.append(p)
-
-        participations = filtered_participations
-    else:
-        participations = participations_query.order_by(ChatParticipant.unread_count.desc()).all()
+    # 2. Fetching CONVERSATIONS (Recent Chats)
+    sidebar = load_sidebar(current_user.id, search_query)
 
+    # 3. Fetching MESSAGES (full-text, first page only)
+    message_hits, more_message_hits = search_messages(current_user.id, search_query)
 
     return render_template('chat/index.html', 
                            title='Chat', 
                            users=users,
-                           participations=participations,
+                           sidebar=sidebar,
+                           message_hits=message_hits,
+                           more_message_hits=more_message_hits,
                            search_query=search_query)
 
+@bp.route('/search/messages')
+@read_replica
+@login_required
+def search_messages_route():
+    """Ranked, paginated full-text search over the user's messages."""
+    search_query = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    messages, has_more = search_messages(current_user.id, search_query, page=page)
+
+    return {
+        'messages': [serialize_message(m, m.room.room_type) for m in messages],
+        'page': page,
+        'has_more': has_more
+    }, 200
+
+@bp.route('/users/search')
+@read_replica
+@login_required
+def user_typeahead():
+    """Top-K prefix matches from the user directory, for typeahead inputs."""
+    users = search_users(
+        request.args.get('q', ''),
+        exclude_user_id=current_user.id,
+        limit=request.args.get('limit', type=int)
+    )
+    return {
+        'users': [{'id': u['id'], 'name': u['name'], 'username': u['username'], 'public_id': u['public_id']} for u in users]
+    }, 200
+
 @bp.route('/start/<int:recipient_id>')
 @login_required
 def start_chat(recipient_id):
@@ -112,6 +117,7 @@ def start_chat(recipient_id):
     return redirect(url_for('chat.view_room', room_id=room.id))
 
 @bp.route('/room/<int:room_id>', methods=['GET', 'POST'])
+@read_replica
 @login_required
 def view_room(room_id):
     """Displays the full chat interface with a specific room selected."""
@@ -122,41 +128,74 @@ def view_room(room_id):
         flash("You are not a member of this chat room.", "danger")
         return redirect(url_for('chat.index'))
 
-    if participation.unread_count > 0:
-        participation.unread_count = 0
-        db.session.commit()
+    # Opening the room reads it. The page shows the badge cleared; the reset
+    # itself runs on the primary once the replica reads are done (below)
+    set_committed_value(participation, 'unread_count', 0)
 
-    messages = active_room.messages.order_by(ChatMessage.timestamp.asc()).all()
-    participations = current_user.chat_participations.order_by(ChatParticipant.unread_count.desc()).all()
+    # Only the latest page is rendered; older pages are fetched while scrolling up
+    messages, has_more_history = get_message_page(active_room.id)
+    sidebar = load_sidebar(current_user.id)
+    active_entry = next((entry for entry in sidebar if entry.room.id == active_room.id), None)
+    if active_entry is None:
+        # Left or removed since the membership check (or a replica not caught up yet)
+        flash("You are not a member of this chat room.", "danger")
+        return redirect(url_for('chat.index'))
 
     chat_partner = None
     last_seen_ist = None
     is_online = False
 
     if active_room.room_type == 'one_to_one':
-        chat_partner = next((part.user for part in active_room.participants if part.user_id != current_user.id), None)
+        chat_partner = active_entry.other_user
+        if chat_partner:
+            is_online = presence.is_online(chat_partner.id)
         if chat_partner and chat_partner.last_seen:
             last_seen_ist = to_ist_str(chat_partner.last_seen)
 
-            # --- ★★★ FIX for Naive vs. Aware Datetime ★★★ ---
-            # Use utcnow() to get a naive datetime in UTC
-            five_min_ago = datetime.utcnow() - timedelta(minutes=5)
-            # Both datetimes are now naive and can be compared
-            if chat_partner.last_seen > five_min_ago:
-                is_online = True
+            # The local registry is the answer on a single worker. Behind a
+            # message queue the partner may be connected to another worker,
+            # whose presence flush keeps last_seen fresh
+            if not is_online and current_app.config['SOCKETIO_MESSAGE_QUEUE']:
+                recent = datetime.utcnow() - timedelta(seconds=2 * current_app.config['PRESENCE_FLUSH_INTERVAL'])
+                is_online = chat_partner.last_seen > recent
 
     form = MessageForm() 
 
-    return render_template('chat/room.html', 
+    page = render_template('chat/room.html', 
                            title="Chat", 
-                           participations=participations, 
+                           sidebar=sidebar, 
                            active_room=active_room,
+                           member_count=active_entry.member_count,
                            messages=messages, 
+                           has_more_history=has_more_history,
                            chat_partner=chat_partner,
                            form=form,
                            last_seen_ist=last_seen_ist,
                            is_online=is_online)
 
+    ChatParticipant.clear_unread(active_room.id, current_user.id)
+    db.session.commit()
+    return page
+
+@bp.route('/room/<int:room_id>/messages')
+@read_replica
+@login_required
+def room_history(room_id):
+    """Returns an older page of a room's messages for infinite scroll."""
+    room = ChatRoom.query.get_or_404(room_id)
+    if not room.participants.filter_by(user_id=current_user.id).first():
+        return {'error': 'Unauthorized'}, 403
+
+    before_id = request.args.get('before', type=int)
+    limit = request.args.get('limit', type=int)
+    messages, has_more = get_message_page(room.id, before_id=before_id, limit=limit)
+
+    return {
+        'messages': [serialize_message(m, room.room_type) for m in messages],
+        'has_more': has_more,
+        'next_cursor': messages[0].id if messages and has_more else None
+    }, 200
+
 @bp.route('/create-group', methods=['GET', 'POST'])
 @login_required
 def create_group():
@@ -164,29 +203,10 @@ def create_group():
     search_query = request.args.get('search_q', '')
     pre_selected_ids = request.args.getlist('members', type=int)
 
-    employees_query = User.query.filter(
-        User.is_active == True,
-        User.id != current_user.id
-    )
-
-    if search_query:
-        search_term = f"%{search_query}%"
-        employees_query = employees_query.filter(
-            or_(
-                User.name.ilike(search_term),
-                User.email.ilike(search_term),
-                User.username.ilike(search_term),
-                User.public_id.ilike(search_term)
-            )
-        )
-
-    employees_to_display = employees_query.order_by(User.name).all()
-
-    all_company_employees = User.query.filter(
-        User.is_active == True, 
-        User.id != current_user.id
-    ).all()
-    form.members.choices = [(u.id, u.name) for u in all_company_employees]
+    # Only the submitted (or pre-selected) IDs can be valid choices,
+    # so one bounded IN query replaces loading the whole user table.
+    requested_ids = request.form.getlist('members', type=int) if request.method == 'POST' else pre_selected_ids
+    form.members.choices = member_choices(requested_ids, current_user.id)
 
     if form.validate_on_submit():
         new_group_room = ChatRoom(
@@ -196,12 +216,11 @@ def create_group():
         db.session.add(new_group_room)
 
         if form.include_creator.data:
-            creator_part = ChatParticipant(user=current_user, room=new_group_room)
+            creator_part = ChatParticipant(user_id=current_user.id, room=new_group_room)
             db.session.add(creator_part)
 
-        selected_members = User.query.filter(User.id.in_(form.members.data)).all()
-        for member in selected_members:
-            part = ChatParticipant(user=member, room=new_group_room)
+        for member_id in form.members.data:
+            part = ChatParticipant(user_id=member_id, room=new_group_room)
             db.session.add(part)
 
         db.session.commit()
@@ -213,95 +232,164 @@ def create_group():
             return redirect(url_for('chat.index'))
 
     if request.method == 'GET' and pre_selected_ids:
-        form.members.data = pre_selected_ids
+        form.members.data = [user_id for user_id, _ in form.members.choices]
+
+    # Selected members stay listed; the rest is one page of candidates
+    selected = [{'id': user_id, 'name': name} for user_id, name in form.members.choices
+                if user_id in (form.members.data or [])]
+    if search_query:
+        candidates, next_cursor = search_users(search_query, exclude_user_id=current_user.id), None
+    else:
+        candidates, next_cursor = list_member_candidates(current_user.id)
+    selected_ids = {u['id'] for u in selected}
+    employees_to_display = selected + [u for u in candidates if u['id'] not in selected_ids]
 
     return render_template('chat/create_group.html', 
                            title="Create New Group", 
                            form=form, 
                            employees=employees_to_display,
+                           next_cursor=next_cursor,
                            search_query=search_query)
 
+@bp.route('/users/candidates')
+@read_replica
+@login_required
+def member_candidates():
+    """Lightweight (id, name) pages of users for the group member picker."""
+    search_query = request.args.get('q', '')
+    limit = request.args.get('limit', type=int)
+
+    if search_query:
+        users = search_users(search_query, exclude_user_id=current_user.id, limit=limit)
+        users, next_cursor = [{'id': u['id'], 'name': u['name']} for u in users], None
+    else:
+        users, next_cursor = list_member_candidates(
+            current_user.id, after_id=request.args.get('after', type=int), limit=limit
+        )
+    return {'users': users, 'next_cursor': next_cursor}, 200
+
+@bp.route('/metrics')
+def metrics_snapshot():
+    """
+    Counters from this worker process's caches and batchers, for monitoring
+    only: requests must send `Authorization: Bearer <METRICS_TOKEN>`, and the
+    endpoint does not exist while METRICS_TOKEN is unset.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    sent = request.headers.get('Authorization', '').encode()
+    if not token or not hmac.compare_digest(sent, f"Bearer {token}".encode()):
+        return {'error': 'Not found'}, 404
+    return metrics.snapshot(), 200
+
 @bp.route('/upload-attachment/<int:room_id>', methods=['POST'])
 @login_required
 def upload_attachment(room_id):
-    room = ChatRoom.query.get_or_404(room_id)
-    if not room.participants.filter_by(user_id=current_user.id).first(): return {'error': 'Unauthorized'}, 403
+    if not is_member(room_id, current_user.id): return {'error': 'Unauthorized'}, 403
+    if (request.content_length or 0) > current_app.config['UPLOAD_MAX_BYTES']:
+        return {'error': 'File is too large.'}, 413
     file = request.files.get('file');
     if not file or file.filename == '': return {'error': 'No file selected'}, 400
 
     filename = secure_filename(file.filename)
 
-    # 1. Create a WEB-FRIENDLY path with forward slashes
-    file_path_relative_web = f"{room.id}/{filename}"
-
-    # 2. Create an OS-FRIENDLY path for saving to disk
-    full_path_on_disk = os.path.join(current_app.config['UPLOAD_FOLDER'], file_path_relative_web.replace('/', os.path.sep))
+    # Land the file under .partial, then move it into the blob store by content
+    # hash, so two files sharing a name in a room no longer overwrite each other
+    temp_path = partial_path(uuid.uuid4().hex)
+    os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+    file.save(temp_path)
+    file_size = os.path.getsize(temp_path)
+    sha256, file_path_relative_web = store(temp_path)
 
-    os.makedirs(os.path.dirname(full_path_on_disk), exist_ok=True)
-    file.save(full_path_on_disk)
-    file_size = os.path.getsize(full_path_on_disk)
-
-    new_message = ChatMessage(sender_id=current_user.id, room_id=room_id, content=f"File: {filename}"); db.session.add(new_message); db.session.flush()
-
-    # 3. Save the WEB-FRIENDLY path to the database
-    attachment = ChatMessageAttachment(message_id=new_message.id, filename=filename, file_path=file_path_relative_web, file_size_bytes=file_size); db.session.add(attachment)
-
-    db.session.flush() # Ensure attachment has an ID
-
-    # 1. Update unread counts BEFORE committing
-    for p in room.participants:
-        if p.user_id != current_user.id:
-            p.unread_count = (p.unread_count or 0) + 1
-            # We will send the socket emit AFTER committing
-
-    # 2. COMMIT all changes to the database
-    db.session.commit()
+    msg_data = publish_attachment(room_id, current_user, filename, file_path_relative_web, file_size, sha256)
+    return {'success': 'File uploaded', 'message_data': msg_data}, 200
 
-    is_image = any(filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg'])
 
-    msg_data = {
-        'id': new_message.id, 
-        'content': new_message.content, 
-        'sender_name': current_user.name, 
-        'sender_id': current_user.id,
-        'timestamp': new_message.timestamp.isoformat() + 'Z',
-        'attachment': {'id': attachment.id, 'filename': attachment.filename, 'is_image': is_image, 'viewed': attachment.viewed},
-        'is_forward': False 
-    }
+# --- Chunked, resumable uploads ---
+# POST /uploads {room_id, filename, size, sha256?} -> {upload_id, offset}
+# PUT /uploads/<id>?offset=N with the raw chunk (optional X-Chunk-SHA256) -> {offset}
+# GET /uploads/<id> -> {offset, size} to resume; POST /uploads/<id>/finalize; DELETE to abort
 
-    # 3. NOW broadcast the message. The attachment is safely in the DB.
-    socketio.send(msg_data, to=str(room_id))
+def _get_own_upload(upload_id):
+    upload = PendingUpload.query.get(upload_id)
+    if not upload or upload.user_id != current_user.id:
+        raise UploadError('Upload not found.', 404)
+    return upload
 
-    # 4. NOW broadcast the unread updates.
-    for p in room.participants:
-        if p.user_id != current_user.id:
-            socketio.emit('unread_update', {'room_id': room_id, 'count': p.unread_count}, to=f"user_{p.user_id}")
+@bp.route('/uploads', methods=['POST'])
+@login_required
+def begin_chunked_upload():
+    data = request.get_json(silent=True) or {}
+    room_id = data.get('room_id')
+    if not is_member(room_id, current_user.id): return {'error': 'Unauthorized'}, 403
+    filename = secure_filename(data.get('filename') or '')
+    if not filename: return {'error': 'No file selected'}, 400
+    try:
+        size = int(data.get('size'))
+        upload = begin_upload(current_user.id, int(room_id), filename, size, data.get('sha256'))
+    except (TypeError, ValueError):
+        return {'error': 'size must be an integer.'}, 400
+    except UploadError as e:
+        return e.response()
+    return {'upload_id': upload.id, 'offset': 0, 'chunk_max': current_app.config['UPLOAD_CHUNK_MAX_BYTES']}, 201
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def chunked_upload_status(upload_id):
+    try:
+        upload = _get_own_upload(upload_id)
+    except UploadError as e:
+        return e.response()
+    return {'upload_id': upload.id, 'offset': received_bytes(upload), 'size': upload.size}, 200
 
+@bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def append_upload_chunk(upload_id):
+    try:
+        upload = _get_own_upload(upload_id)
+        offset = append_chunk(upload, request.args.get('offset', type=int, default=-1), request.stream,
+                              request.content_length, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return e.response()
+    return {'upload_id': upload.id, 'offset': offset}, 200
+
+@bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_chunked_upload(upload_id):
+    try:
+        upload = _get_own_upload(upload_id)
+        if not is_member(upload.room_id, current_user.id):
+            raise UploadError('Unauthorized', 403)
+        msg_data = finish_upload(upload, current_user)
+    except UploadError as e:
+        return e.response()
     return {'success': 'File uploaded', 'message_data': msg_data}, 200
 
+@bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_chunked_upload(upload_id):
+    try:
+        cancel_upload(_get_own_upload(upload_id))
+    except UploadError as e:
+        return e.response()
+    return {'success': 'Upload cancelled'}, 200
+
 
 @bp.route('/attachment/<int:attachment_id>')
 @login_required
 def get_attachment(attachment_id):
-    attachment = ChatMessageAttachment.query.get(attachment_id)
-    if not attachment:
+    found = load_attachment(attachment_id, current_user.id)
+    if not found:
         flash("Attachment not found in database.", "danger")
         return redirect(request.referrer or url_for('chat.index'))
 
-    room_id_for_redirect = attachment.message.room_id 
+    attachment = found.ChatMessageAttachment
+    room_id_for_redirect = found.room_id
 
-    if not attachment.message.room.participants.filter_by(user_id=current_user.id).first():
+    if found.participant_id is None:
         flash("Unauthorized", "danger")
         return redirect(url_for('chat.index'))
 
-    directory = current_app.config['UPLOAD_FOLDER']
-
-    # 1. Get the WEB-FRIENDLY path from the DB (e.g., "1/file.jpg")
-    path_relative_web = attachment.file_path
-
-    # 2. Create the OS-FRIENDLY path for all disk operations
-    path_relative_os = path_relative_web.replace('/', os.path.sep)
-    full_file_path_on_disk = os.path.join(directory, path_relative_os)
+    full_file_path_on_disk = disk_path(attachment.file_path)
 
     if not os.path.exists(full_file_path_on_disk):
         flash("This attachment is no longer available on disk.", "warning")
@@ -320,144 +408,111 @@ def get_attachment(attachment_id):
             db.session.rollback()
         return redirect(url_for('chat.view_room', room_id=room_id_for_redirect))
 
-    is_recipient = attachment.message.sender_id != current_user.id
+    is_recipient = found.sender_id != current_user.id
 
     if attachment.viewed and is_recipient:
         flash("This attachment has already been viewed and is no longer available.", "warning")
         return redirect(url_for('chat.view_room', room_id=room_id_for_redirect))
 
-    # --- ★★★ THIS IS THE FINAL 404 FIX ★★★ ---
-    # We pass the directory and the WEB-FRIENDLY path.
-    # `send_from_directory` is smart enough to handle this conversion.
-    # My previous fix (path_relative_os) was wrong. This is the correct way.
-    response = send_from_directory(directory, path_relative_web, as_attachment=True)
-    # --- ★★★ END OF FIX ★★★ ---
+    # A view-once download always sends the whole file, with no Range or revalidation
+    response = attachment_response(attachment, conditional=not is_recipient)
 
-    if is_recipient:
+    # View-once: any response that carries the body counts as the one view.
+    # The delete job runs after this response; an offloaded one waits until the
+    # front server has had time to read the file.
+    if is_recipient and 200 <= response.status_code < 300:
         attachment.viewed = True
+        attachment.viewed_at = datetime.utcnow()
+        jobs.enqueue('attachments.delete_viewed',
+                     delay=current_app.config['VIEWED_ATTACHMENT_MAX_AGE'] if is_offloaded() else 0,
+                     attachment_id=attachment.id)
         db.session.commit()
         socketio.emit('attachment_viewed', {'attachment_id': attachment.id}, to=str(room_id_for_redirect))
 
-        def delete_file_and_record(app_instance):
-            with app_instance.app_context():
-                try:
-                    att_to_delete = ChatMessageAttachment.query.get(attachment_id)
-                    if att_to_delete:
-                        msg_to_update = att_to_delete.message
-                        room_id = msg_to_update.room_id
-                        msg_id = msg_to_update.id
-
-                        # Use the OS-FRIENDLY path for deletion
-                        file_path_to_delete = os.path.join(app_instance.config['UPLOAD_FOLDER'], att_to_delete.file_path.replace('/', os.path.sep))
-
-                        if os.path.exists(file_path_to_delete):
-                            os.remove(file_path_to_delete)
-
-                        msg_to_update.content = "[Attachment downloaded and removed]"
-                        db.session.add(msg_to_update)
-                        db.session.delete(att_to_delete)
-                        db.session.commit()
-
-                        socketio.emit('attachment_deleted', {
-                            'attachment_id': attachment_id, 
-                            'message_id': msg_id
-                        }, to=str(room_id))
-                except Exception as e:
-                    app_instance.logger.error(f"Error in post-request deletion for {attachment_id}: {e}")
-                    db.session.rollback()
-
-        real_app = current_app._get_current_object()
-        deleter_thread = threading.Thread(
-            target=delete_file_and_record, 
-            args=(real_app,)
-        )
-        deleter_thread.start()
-
     return response
 
-@bp.route('/cleanup-attachments')
-def cleanup_attachments_route():
-    cleanup_viewed_attachments()
-    return "Cleanup finished."
-
-def cleanup_viewed_attachments():
-    """Finds viewed attachments older than 5 minutes and deletes them."""
-    # Use utcnow() for naive datetime comparison
-    five_minutes_ago = datetime.utcnow() - timedelta(minutes=5)
-
-    attachments_to_delete = ChatMessageAttachment.query.filter(
-        ChatMessageAttachment.viewed == True,
-        ChatMessageAttachment.message.has(ChatMessage.timestamp < five_minutes_ago)
-    ).all()
-
-    for attachment in attachments_to_delete:
-        try:
-            # FIX: Use OS-friendly path for deletion
-            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], attachment.file_path.replace('/', os.path.sep))
-            if os.path.exists(full_path):
-                os.remove(full_path)
-            db.session.delete(attachment)
-        except Exception as e:
-            current_app.logger.error(f"Error deleting file {attachment.file_path}: {e}")
-            db.session.rollback()
-
-    db.session.commit()
+@bp.route('/attachment/<int:attachment_id>/thumbnail')
+@login_required
+def get_attachment_thumbnail(attachment_id):
+    """Image preview; cacheable, and never counts as viewing a view-once attachment."""
+    found = load_attachment(attachment_id, current_user.id)
+    if not found or found.participant_id is None:
+        return {'error': 'Not found'}, 404
+    return thumbnail_response(found.ChatMessageAttachment)
 
 
 # --- START: SOCKET.IO HANDLERS ---
 
 @socketio.on('connect')
-def on_connect():
+def on_connect(auth=None):
+    codec.negotiate(auth)
     if current_user.is_authenticated:
-        join_room(f"user_{current_user.id}")
-
-        # FIX for Naive vs. Aware: Use utcnow()
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
-
-        for p in current_user.chat_participations:
-            emit('user_status_update', 
-                 {'user_id': current_user.id, 'status': 'Online'}, 
-                 to=str(p.room_id), 
-                 include_self=False)
+        # The one user load for this connection; handlers use the snapshot
+        user = socket_users.connect(request.sid, current_user)
+        join_room(codec.variant(f"user_{user.id}", codec.is_compact()))
+        codec.subscriptions.add(request.sid, codec.variant('', codec.is_compact()))
+        presence.connect(user.id, request.sid)
 
 @socketio.on('disconnect')
 def on_disconnect():
-    if current_user.is_authenticated:
-        # FIX for Naive vs. Aware: Use utcnow()
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
-
-        # This logic is now correct, as last_seen is naive UTC
-        last_seen_utc = current_user.last_seen.replace(tzinfo=timezone.utc) 
-        last_seen_ist = last_seen_utc.astimezone(ZoneInfo("Asia/Kolkata"))
-        last_seen_str = f"Last seen at {last_seen_ist.strftime('%I:%M %p')}"
-
-        for p in current_user.chat_participations:
-            emit('user_status_update', 
-                 {'user_id': current_user.id, 'status': last_seen_str}, 
-                 to=str(p.room_id), 
-                 include_self=False)
+    user = socket_user()
+    if user is not None:
+        presence.disconnect(user.id, request.sid)
+        socket_users.disconnect(request.sid)
+    codec.subscriptions.remove(request.sid)
+
+@socketio.on('heartbeat')
+def on_heartbeat():
+    user = socket_user()
+    if user is not None:
+        presence.heartbeat(request.sid, user.id)
 
 @socketio.on('join')
 def on_join(data):
     room = data['room']
-    join_room(room)
+    user = socket_user()
+    compact = codec.is_compact()
+    if user is not None and room == f"user_{user.id}":
+        # Unread updates, in the codec negotiated at connect
+        return join_room(codec.variant(room, compact))
+    if user is None or not is_member(room, user.id):
+        return
+
+    # Room events (typing, attachments, forwards), then new messages: one
+    # `message` each, or `message_batch` frames for clients asking for them
+    batched = bool(data.get('batch'))
+    join_room(str(room))
+    join_room(message_room(room, batched=batched, compact=compact))
+    codec.subscriptions.add(request.sid, message_kind(batched=batched, compact=compact))
+
+    # Opening a 1:1 room subscribes to the partner's status changes
+    members = room_members(int(room))
+    if len(members) == 2:
+        active_room = ChatRoom.query.get(int(room))
+        if active_room.room_type == 'one_to_one':
+            for user_id in members - {user.id}:
+                join_room(codec.variant(presence_room(user_id), compact))
 
 @socketio.on('send_message')
 def on_send_message(data):
     """This function is the correct pattern. Commit before send."""
     room_id = data['room']; content = data['message']
-    room = ChatRoom.query.get(room_id)
-    if not room or not room.participants.filter_by(user_id=current_user.id).first(): return
+    sender = socket_user()
+    if sender is None or not is_member(room_id, sender.id): return
+    room_id = int(room_id)
+    if not isinstance(content, str):
+        return emit('error', {'message': 'Message must be text.'})
+
+    if current_app.config['MESSAGE_INGEST_ENABLED']:
+        # Group-committed and broadcast by the ingestor's background task
+        return message_ingestor.submit(room_id, sender.id, sender.name, content, request.sid)
 
-    new_message = ChatMessage(sender_id=current_user.id, room_id=room_id, content=content)
+    new_message = ChatMessage(sender_id=sender.id, room_id=room_id, content=content)
     db.session.add(new_message)
+    db.session.flush()
+    ChatRoom.record_activity(room_id, new_message)
 
-    for p in room.participants:
-        if p.user_id != current_user.id:
-            p.unread_count = (p.unread_count or 0) + 1
-            # We will emit the update *after* the commit
+    unread_rows = ChatParticipant.bump_unread(room_id, sender.id)
 
     # 1. COMMIT FIRST
     db.session.commit() 
@@ -465,29 +520,31 @@ def on_send_message(data):
     msg_data = {
         'id': new_message.id, 
         'content': content, 
-        'sender_name': current_user.name, 
-        'sender_id': current_user.id, 
+        'sender_name': sender.name, 
+        'sender_id': sender.id, 
         'timestamp': new_message.timestamp.isoformat() + 'Z', 
         'attachment': None, 
         'is_forward': False
     }
 
     # 2. SEND LATER
-    send(msg_data, to=str(room_id))
+    message_batcher.publish(room_id, msg_data)
 
     # 3. SEND UNREAD UPDATES LATER
-    for p in room.participants:
-        if p.user_id != current_user.id:
-            socketio.emit('unread_update', {'room_id': room_id, 'count': p.unread_count}, to=f"user_{p.user_id}")
+    unread_notifier.add(room_id, unread_rows)
 
 
 @socketio.on('start_typing')
 def on_start_typing(data):
-    emit('typing_started', {'user_name': current_user.name, 'user_id': current_user.id}, to=data['room'], include_self=False)
+    user = socket_user()
+    if user is not None and is_member(data['room'], user.id):
+        typing_tracker.start(str(data['room']), user.id, user.name)
 
 @socketio.on('stop_typing')
 def on_stop_typing(data):
-    emit('typing_stopped', {'user_id': current_user.id}, to=data['room'], include_self=False)
+    user = socket_user()
+    if user is not None and is_member(data['room'], user.id):
+        typing_tracker.stop(str(data['room']), user.id)
 
 
 @bp.route('/delete-room/<int:room_id>', methods=['POST'])
@@ -498,15 +555,11 @@ def delete_conversation(room_id):
         flash("Unauthorized to delete this conversation.", "danger")
         return redirect(url_for('chat.index'))
     try:
-        attachments = ChatMessageAttachment.query.join(ChatMessage).filter(ChatMessage.room_id == room_id).all()
-        for attachment in attachments:
-            # FIX: Use OS-friendly path for deletion
-            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], attachment.file_path.replace('/', os.path.sep))
-            if os.path.exists(full_path):
-                os.remove(full_path)
-
-        # Deleting the room will cascade and delete all participants, messages, and attachments
-        db.session.delete(room_to_delete) 
+        # Removing the participants hides the room from everyone right away; the
+        # messages, attachments (and their files) and the room row go in a job
+        for participant in room_to_delete.participants:
+            db.session.delete(participant)
+        jobs.enqueue('rooms.purge', room_id=room_id)
         db.session.commit()
         flash('Conversation has been successfully deleted.', 'success')
     except Exception as e:
@@ -518,116 +571,31 @@ def delete_conversation(room_id):
 
 # --- START: ADDED FORWARD HANDLERS ---
 @socketio.on('forward_multiple_messages')
-@login_required
 def on_forward_multiple_messages(data):
+    sender = socket_user()
+    if sender is None:
+        return
+    if not isinstance(data, dict):
+        return emit('error', {'message': 'Invalid forward request.'})
     original_message_ids = data.get('original_message_ids', [])
-    destination_room_id = data.get('destination_room_id')
-
-    if not original_message_ids or not destination_room_id:
-        return emit('error', {'message': 'Missing message IDs or room ID.'})
-
-    destination_room = ChatRoom.query.get(destination_room_id)
-
-    if not destination_room.participants.filter_by(user_id=current_user.id).first():
-        return emit('error', {'message': 'Unauthorized to send to this room.'})
-
-    messages_to_forward = ChatMessage.query.filter(
-        ChatMessage.id.in_(original_message_ids)
-    ).order_by(ChatMessage.timestamp.asc()).all()
+    # A list of rooms; older clients send a single destination_room_id
+    destination_room_ids = data.get('destination_room_ids') or \
+        ([data['destination_room_id']] if data.get('destination_room_id') else [])
 
-    message_count = 0
-    all_new_msg_data = [] # FIX: Create a list to hold messages
     try:
-        for msg in messages_to_forward:
-            if not msg.room.participants.filter_by(user_id=current_user.id).first():
-                continue 
-
-            message_count += 1
-            new_content = f"[Forwarded]: {msg.content}"
-            new_message = ChatMessage(
-                sender_id=current_user.id,
-                room_id=destination_room.id,
-                content=new_content
-            )
-            db.session.add(new_message)
-            db.session.flush() 
-
-            original_attachment = msg.attachment
-            new_attachment_data = None
-
-            if original_attachment:
-                # FIX: Use OS-friendly path for source
-                original_full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], original_attachment.file_path.replace('/', os.path.sep))
-
-                new_filename = f"{new_message.id}_{original_attachment.filename}" # Make unique
-
-                # FIX: Use WEB-FRIENDLY path for new DB entry
-                new_relative_path_web = f"{destination_room.id}/{new_filename}"
-                # FIX: Use OS-FRIENDLY path for new disk location
-                new_full_path_on_disk = os.path.join(current_app.config['UPLOAD_FOLDER'], new_relative_path_web.replace('/', os.path.sep))
-
-                if os.path.exists(original_full_path):
-                    os.makedirs(os.path.dirname(new_full_path_on_disk), exist_ok=True)
-                    shutil.copy(original_full_path, new_full_path_on_disk)
-
-                    new_attachment = ChatMessageAttachment(
-                        message_id=new_message.id,
-                        filename=new_filename,
-                        file_path=new_relative_path_web, # Save web-friendly path
-                        file_size_bytes=original_attachment.file_size_bytes
-                    )
-                    db.session.add(new_attachment)
-                    db.session.flush()
-
-                    is_image = any(new_filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg'])
-                    new_attachment_data = {
-                        'id': new_attachment.id, 
-                        'filename': new_attachment.filename, 
-                        'is_image': is_image, 
-                        'viewed': False
-                    }
-                else:
-                    new_message.content += " (Original attachment was missing)"
-
-            msg_data = {
-                'id': new_message.id, 
-                'content': new_message.content, 
-                'sender_name': current_user.name, 
-                'sender_id': current_user.id, 
-                'timestamp': new_message.timestamp.isoformat() + 'Z', 
-                'attachment': new_attachment_data,
-                'room_type': destination_room.room_type,
-                'is_forward': True
-            }
-            all_new_msg_data.append(msg_data) # FIX: Add to list, don't send
-
-        if message_count > 0:
-            for p in destination_room.participants:
-                if p.user_id != current_user.id:
-                    p.unread_count = (p.unread_count or 0) + message_count
-                    # We will emit this update *after* the commit
-
-        # --- FIX FOR RACE CONDITION ---
-        # 1. COMMIT FIRST
-        db.session.commit()
-
-        # 2. SEND MESSAGES LATER
-        for msg_data in all_new_msg_data:
-            send(msg_data, to=str(destination_room.id))
-
-        # 3. SEND UNREAD UPDATES LATER
-        if message_count > 0:
-            for p in destination_room.participants:
-                if p.user_id != current_user.id:
-                    socketio.emit('unread_update', 
-                                  {'room_id': destination_room.id, 'count': p.unread_count}, 
-                                  to=f"user_{p.user_id}")
-        # --- END OF FIX ---
-
+        payloads, unread = forward_messages(sender, original_message_ids, destination_room_ids)
+    except (ForwardError, ValueError, TypeError) as e:
+        db.session.rollback()
+        return emit('error', {'message': str(e) if isinstance(e, ForwardError) else 'Invalid forward request.'})
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error forwarding multiple messages: {e}")
-        emit('error', {'message': f'An internal error occurred: {str(e)}'})
+        return emit('error', {'message': f'An internal error occurred: {str(e)}'})
+
+    # Committed: one batched event per destination, then the unread updates
+    for room_id, messages in payloads.items():
+        message_batcher.publish_many(room_id, messages)
+        unread_notifier.add(room_id, unread[room_id])
 
 # --- END: ADDED FORWARD HANDLERS ---
 
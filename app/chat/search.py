@@ -0,0 +1,134 @@
+import re
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.models import ChatMessage, ChatParticipant
+
+
+# Full-text index over chat_message.content, kept in sync by the database itself.
+# SQLite: an external-content FTS5 table maintained by triggers.
+# PostgreSQL: a GIN expression index, which the planner keeps current on its own.
+SEARCH_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+        "content, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS chat_message_fts_ai AFTER INSERT ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content); END",
+        "CREATE TRIGGER IF NOT EXISTS chat_message_fts_ad AFTER DELETE ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+        "CREATE TRIGGER IF NOT EXISTS chat_message_fts_au AFTER UPDATE OF content ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content); END",
+    ],
+    'postgresql': [
+        "CREATE INDEX IF NOT EXISTS ix_chat_message_content_fts ON chat_message "
+        "USING gin (to_tsvector('simple', coalesce(content, '')))",
+    ],
+}
+
+SEARCH_DROP_DDL = {
+    'sqlite': ["DROP TABLE IF EXISTS chat_message_fts"],
+    'postgresql': ["DROP INDEX IF EXISTS ix_chat_message_content_fts"],
+}
+
+
+@event.listens_for(ChatMessage.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    """Lets db.create_all() build the same index the migration does."""
+    for statement in SEARCH_DDL.get(connection.dialect.name, ()):
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(ChatMessage.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    for statement in SEARCH_DROP_DDL.get(connection.dialect.name, ()):
+        connection.exec_driver_sql(statement)
+
+
+def fts5_query(search_query):
+    """
+    Turns free text into a safe FTS5 MATCH expression.
+    Every word must match; the last one is a prefix so results follow typing.
+    """
+    words = re.findall(r'\w+', search_query, re.UNICODE)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _ranked_ids_sqlite(user_id, search_query, limit, offset):
+    match = fts5_query(search_query)
+    if not match:
+        return []
+    return db.session.execute(text("""
+        SELECT m.id
+        FROM chat_message_fts
+        JOIN chat_message m ON m.id = chat_message_fts.rowid
+        JOIN chat_participant p ON p.room_id = m.room_id AND p.user_id = :user_id
+        WHERE chat_message_fts MATCH :match
+        ORDER BY bm25(chat_message_fts), m.id DESC
+        LIMIT :limit OFFSET :offset
+    """), {'user_id': user_id, 'match': match, 'limit': limit, 'offset': offset}).scalars().all()
+
+
+def _ranked_ids_postgresql(user_id, search_query, limit, offset):
+    return db.session.execute(text("""
+        SELECT m.id
+        FROM chat_message m
+        JOIN chat_participant p ON p.room_id = m.room_id AND p.user_id = :user_id,
+             websearch_to_tsquery('simple', :q) AS query
+        WHERE to_tsvector('simple', coalesce(m.content, '')) @@ query
+        ORDER BY ts_rank(to_tsvector('simple', coalesce(m.content, '')), query) DESC, m.id DESC
+        LIMIT :limit OFFSET :offset
+    """), {'user_id': user_id, 'q': search_query, 'limit': limit, 'offset': offset}).scalars().all()
+
+
+def _ranked_ids_fallback(user_id, search_query, limit, offset):
+    # No full-text support on this backend: substring match, newest first
+    rows = db.session.query(ChatMessage.id)\
+        .join(ChatParticipant, db.and_(ChatParticipant.room_id == ChatMessage.room_id,
+                                       ChatParticipant.user_id == user_id))\
+        .filter(ChatMessage.content.ilike(f"%{search_query}%"))\
+        .order_by(ChatMessage.id.desc()).limit(limit).offset(offset).all()
+    return [row.id for row in rows]
+
+
+_RANKERS = {
+    'sqlite': _ranked_ids_sqlite,
+    'postgresql': _ranked_ids_postgresql,
+}
+
+
+def search_messages(user_id, search_query, page=1, per_page=None):
+    """
+    Ranked full-text search over messages in rooms the user belongs to.
+    Returns (messages, has_more) for the requested 1-based page.
+    """
+    search_query = (search_query or '').strip()
+    if not search_query:
+        return [], False
+
+    per_page = per_page or current_app.config['SEARCH_PAGE_SIZE']
+    page = max(page or 1, 1)
+
+    dialect = db.session.get_bind().dialect.name
+    ranker = _RANKERS.get(dialect, _ranked_ids_fallback)
+    # Fetch one extra id to know whether another page exists
+    ids = ranker(user_id, search_query, per_page + 1, (page - 1) * per_page)
+
+    has_more = len(ids) > per_page
+    ids = ids[:per_page]
+    if not ids:
+        return [], False
+
+    by_id = {
+        m.id: m for m in ChatMessage.query.options(
+            joinedload(ChatMessage.sender),
+            joinedload(ChatMessage.room),
+            selectinload(ChatMessage.attachment)
+        ).filter(ChatMessage.id.in_(ids)).all()
+    }
+    return [by_id[i] for i in ids if i in by_id], has_more
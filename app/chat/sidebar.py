@@ -0,0 +1,87 @@
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.orm import contains_eager
+from app import db
+from app.models import User, ChatRoom, ChatParticipant
+
+
+class SidebarEntry:
+    """One conversation in the sidebar, with everything the templates need preloaded."""
+
+    __slots__ = ('participation', 'room', 'other_user', 'member_count')
+
+    def __init__(self, participation, other_user=None, member_count=0):
+        self.participation = participation
+        self.room = participation.room
+        self.other_user = other_user
+        self.member_count = member_count
+
+    @property
+    def last_message(self):
+        return self.room.last_message
+
+    @property
+    def unread_count(self):
+        return self.participation.unread_count or 0
+
+    @property
+    def chat_name(self):
+        return self.other_user.name if self.other_user else (self.room.name or 'Chat')
+
+
+
+def load_sidebar(user_id, search_query=None):
+    """
+    Loads every conversation of a user for the sidebar in a fixed number of queries.
+    With a search query, only group rooms whose name matches and one-to-one rooms
+    whose other member's name or email matches are returned, filtered in SQL.
+
+    1. participations joined with their rooms, most recent activity first
+    2. each room's last message, via the denormalized ChatRoom.last_message_id
+    3. member counts per room
+    4. the counterpart user of each one-to-one room
+
+    The cost does not depend on how many conversations the user has.
+    """
+    query = ChatParticipant.query.join(ChatParticipant.room)\
+        .options(contains_eager(ChatParticipant.room).selectinload(ChatRoom.last_message))\
+        .filter(ChatParticipant.user_id == user_id)
+
+    if search_query:
+        search_term = f"%{search_query}%"
+        query = query.filter(or_(
+            and_(ChatRoom.room_type == 'group', ChatRoom.name.ilike(search_term)),
+            and_(ChatRoom.room_type == 'one_to_one', ChatRoom.participants.any(and_(
+                ChatParticipant.user_id != user_id,
+                ChatParticipant.user.has(or_(User.name.ilike(search_term), User.email.ilike(search_term)))
+            )))
+        ))
+
+    participations = query.order_by(ChatRoom.last_activity_at.desc().nulls_last(), ChatRoom.id.desc()).all()
+
+    if not participations:
+        return []
+
+    my_room_ids = select(ChatParticipant.room_id).where(ChatParticipant.user_id == user_id)
+
+    member_counts = dict(
+        db.session.query(ChatParticipant.room_id, func.count(ChatParticipant.id))
+        .filter(ChatParticipant.room_id.in_(my_room_ids))
+        .group_by(ChatParticipant.room_id).all()
+    )
+
+    other_users = {}
+    if any(p.room.room_type == 'one_to_one' for p in participations):
+        rows = db.session.query(ChatParticipant.room_id, User)\
+            .join(User, User.id == ChatParticipant.user_id)\
+            .filter(ChatParticipant.room_id.in_(my_room_ids), ChatParticipant.user_id != user_id).all()
+        for room_id, user in rows:
+            other_users.setdefault(room_id, user)
+
+    return [
+        SidebarEntry(
+            p,
+            other_user=other_users.get(p.room_id) if p.room.room_type == 'one_to_one' else None,
+            member_count=member_counts.get(p.room_id, 0)
+        )
+        for p in participations
+    ]
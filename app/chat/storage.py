@@ -0,0 +1,232 @@
+import hashlib
+import os
+import shutil
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from app import db
+from app import metrics
+from app.models import ChatMessageAttachment, AttachmentBlob
+
+READ_BLOCK = 64 * 1024
+BLOB_DIR = 'blobs'
+DERIVATIVE_DIR = 'derivatives'
+
+_stats = {'stored': 0, 'deduplicated': 0, 'adopted': 0, 'collected': 0}
+
+metrics.register('attachment_store', lambda: dict(_stats))
+
+
+# --- Content-addressed blobs: every attachment file lives once under
+# UPLOAD_FOLDER/blobs/ab/<sha256>, however many messages point at it.
+# attachment_blob.ref_count follows the attachment rows (see the mapper
+# events below); the row and the file go when the last reference does.
+# Writers take their reference before looking at the file, and the
+# collector claims the row before unlinking it, so the two serialize on the
+# blob row instead of racing on the disk.
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def blob_path(sha256):
+    """WEB-FRIENDLY path of a blob, relative to UPLOAD_FOLDER."""
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}"
+
+
+def derivative_path(sha256, extension='jpg'):
+    """WEB-FRIENDLY path of a file derived from a blob (its thumbnail), relative to UPLOAD_FOLDER."""
+    return f"{DERIVATIVE_DIR}/{sha256[:2]}/{sha256}.{extension}"
+
+
+def disk_path(path_web):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], path_web.replace('/', os.path.sep))
+
+
+def store(src_path, sha256=None):
+    """
+    Moves the file at `src_path` into the store and returns (sha256, path).
+    If the content is already stored the source is just removed. The
+    reference is taken here, in the caller's transaction, before the file
+    is checked; the attachment row flushed next uses it (see _pin).
+    """
+    sha256 = sha256 or file_sha256(src_path)
+    _pin(sha256, os.path.getsize(src_path))
+    path_web = blob_path(sha256)
+    full_path = disk_path(path_web)
+    if os.path.exists(full_path):
+        os.remove(src_path)
+        _stats['deduplicated'] += 1
+    else:
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.replace(src_path, full_path)
+        _stats['stored'] += 1
+    return sha256, path_web
+
+
+def adopt(attachment):
+    """
+    Points a pre-store attachment (stored under <room>/<name>) at a blob of
+    the same content so it can be shared. The blob is a hard link, and the
+    old name is only removed once the change commits. Returns False if the
+    file is missing.
+    """
+    if attachment.blob_sha256:
+        return os.path.exists(disk_path(attachment.file_path))
+    full_path = disk_path(attachment.file_path)
+    if not os.path.exists(full_path):
+        return False
+    sha256 = file_sha256(full_path)
+    _pin(sha256, attachment.file_size_bytes)
+    path_web = blob_path(sha256)
+    blob_full_path = disk_path(path_web)
+    if not os.path.exists(blob_full_path):
+        os.makedirs(os.path.dirname(blob_full_path), exist_ok=True)
+        try:
+            os.link(full_path, blob_full_path)
+        except OSError:
+            shutil.copyfile(full_path, blob_full_path)
+    db.session.info.setdefault('released_files', {})[attachment.file_path] = None
+    attachment.blob_sha256, attachment.file_path = sha256, path_web
+    _stats['adopted'] += 1
+    return True
+
+
+# --- Reference counting, inside the flush that adds or removes the rows
+
+def add_ref(connection, sha256, size, n=1):
+    """
+    Takes `n` references on a blob. The mapper events below call it for ORM
+    inserts; bulk inserts, which skip those events, must call it themselves.
+    """
+    table = AttachmentBlob.__table__
+    updated = connection.execute(
+        table.update().where(table.c.sha256 == sha256).values(ref_count=table.c.ref_count + n)
+    ).rowcount
+    if not updated:
+        connection.execute(table.insert().values(sha256=sha256, size=size or 0, ref_count=n))
+
+
+def _pin(sha256, size):
+    """
+    Takes a reference on a blob in the current transaction before its file
+    is looked at. A collection of the same blob (see _remove_released) then
+    either commits first, so the file is seen as missing and written again,
+    or waits for this transaction and keeps the file. The next attachment
+    row flushed for the blob uses the pinned reference instead of taking
+    another; pins still unused at commit are released.
+    """
+    add_ref(db.session.connection(), sha256, size)
+    pins = db.session.info.setdefault('pinned_blobs', {})
+    pins[sha256] = pins.get(sha256, 0) + 1
+
+
+def _take_ref(connection, target, sha256, size):
+    session = Session.object_session(target)
+    pins = session.info.get('pinned_blobs') if session is not None else None
+    if pins and pins.get(sha256):
+        pins[sha256] -= 1
+    else:
+        add_ref(connection, sha256, size)
+
+
+def _release(connection, session, sha256, path_web, n=1):
+    if sha256:
+        table = AttachmentBlob.__table__
+        connection.execute(
+            table.update().where(table.c.sha256 == sha256).values(ref_count=table.c.ref_count - n)
+        )
+        collected = connection.execute(
+            table.delete().where(table.c.sha256 == sha256, table.c.ref_count <= 0)
+        ).rowcount
+        if not collected:
+            return
+    # Last reference (or a pre-store file): delete from disk once committed
+    if session is not None:
+        session.info.setdefault('released_files', {})[path_web] = sha256
+
+
+@event.listens_for(ChatMessageAttachment, 'after_insert')
+def _attachment_added(mapper, connection, attachment):
+    if attachment.blob_sha256:
+        _take_ref(connection, attachment, attachment.blob_sha256, attachment.file_size_bytes)
+
+
+@event.listens_for(ChatMessageAttachment, 'after_delete')
+def _attachment_deleted(mapper, connection, attachment):
+    _release(connection, Session.object_session(attachment), attachment.blob_sha256, attachment.file_path)
+
+
+@event.listens_for(ChatMessageAttachment, 'after_update')
+def _attachment_moved(mapper, connection, attachment):
+    history = db.inspect(attachment).attrs.blob_sha256.history
+    if not history.has_changes():
+        return
+    for sha256 in history.deleted:
+        if sha256:
+            _release(connection, Session.object_session(attachment), sha256, blob_path(sha256))
+    if attachment.blob_sha256:
+        _take_ref(connection, attachment, attachment.blob_sha256, attachment.file_size_bytes)
+
+
+@event.listens_for(Session, 'before_commit')
+def _release_unused_pins(session):
+    if not session.info.get('pinned_blobs'):
+        return
+    session.flush()
+    pins = session.info.pop('pinned_blobs', {})
+    connection = session.connection()
+    for sha256, n in pins.items():
+        if n:
+            _release(connection, session, sha256, blob_path(sha256), n)
+
+
+def _claim(connection, sha256):
+    """
+    Locks an unreferenced blob for collection by inserting a placeholder row
+    for it; False if the blob is referenced again (the insert conflicts, or
+    waits for a pinning transaction and then conflicts). A lock timeout
+    also keeps the file: leaking it is safe, deleting it is not.
+    """
+    try:
+        connection.execute(AttachmentBlob.__table__.insert().values(sha256=sha256, size=0, ref_count=0))
+    except (IntegrityError, OperationalError):
+        connection.rollback()
+        return False
+    return True
+
+
+@event.listens_for(Session, 'after_commit')
+def _remove_released(session):
+    released = session.info.pop('released_files', None)
+    if not released:
+        return
+    table = AttachmentBlob.__table__
+    with db.engine.connect() as connection:
+        for path_web, sha256 in released.items():
+            # A concurrent upload may have stored the same content again since
+            if sha256 and not _claim(connection, sha256):
+                continue
+            try:
+                os.remove(disk_path(path_web))
+                _stats['collected'] += 1
+            except OSError:
+                pass
+            if sha256:
+                try:
+                    os.remove(disk_path(derivative_path(sha256)))
+                except OSError:
+                    pass
+                connection.execute(table.delete().where(table.c.sha256 == sha256, table.c.ref_count <= 0))
+                connection.commit()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_released(session):
+    session.info.pop('released_files', None)
+    session.info.pop('pinned_blobs', None)
@@ -0,0 +1,96 @@
+import time
+import threading
+from flask import current_app
+from app import socketio
+from app import metrics
+
+
+class TypingTracker:
+    """
+    Server-side typing state per room, broadcast as one aggregated
+    `typing_update` {'room', 'users': [{user_id, user_name}], 'count'} per room
+    at most every `interval` seconds, and only when the set of typists changed.
+    Start events just refresh a typist's expiry, so clients may repeat them
+    freely; typists who never send stop_typing disappear after `ttl` seconds.
+    """
+
+    def __init__(self):
+        self.interval = 0.5
+        self.ttl = 6.0
+        self.events_in = 0
+        self.updates_out = 0
+        self.expired = 0
+        self._typing = {}   # room -> {user_id: (user_name, expires at)}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._task = None
+        self._app = None
+
+    def _start(self):
+        if self._task is None:
+            self.interval = current_app.config['TYPING_UPDATE_INTERVAL']
+            self.ttl = current_app.config['TYPING_TTL']
+            self._app = current_app._get_current_object()
+            self._task = socketio.start_background_task(self._run)
+
+    def start(self, room, user_id, user_name):
+        with self._lock:
+            self._start()
+            self.events_in += 1
+            typists = self._typing.setdefault(room, {})
+            if user_id not in typists:
+                self._dirty.add(room)
+            typists[user_id] = (user_name, time.monotonic() + self.ttl)
+
+    def stop(self, room, user_id):
+        with self._lock:
+            self._start()
+            self.events_in += 1
+            typists = self._typing.get(room)
+            if typists and typists.pop(user_id, None) is not None:
+                self._dirty.add(room)
+                if not typists:
+                    del self._typing[room]
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self._app.logger.error(f"Error flushing typing updates: {e}")
+
+    def flush(self):
+        now = time.monotonic()
+        with self._lock:
+            for room, typists in list(self._typing.items()):
+                stale = [user_id for user_id, (_, expires) in typists.items() if expires <= now]
+                for user_id in stale:
+                    del typists[user_id]
+                if stale:
+                    self.expired += len(stale)
+                    self._dirty.add(room)
+                if not typists:
+                    del self._typing[room]
+            updates = {
+                room: [{'user_id': user_id, 'user_name': name}
+                       for user_id, (name, _) in self._typing.get(room, {}).items()]
+                for room in self._dirty
+            }
+            self._dirty.clear()
+            self.updates_out += len(updates)
+        for room, users in updates.items():
+            socketio.emit('typing_update', {'room': room, 'users': users, 'count': len(users)}, to=room)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'events_in': self.events_in,
+                'updates_out': self.updates_out,
+                'expired': self.expired,
+                'rooms_typing': len(self._typing),
+            }
+
+
+typing_tracker = TypingTracker()
+metrics.register('typing', typing_tracker.stats)
@@ -0,0 +1,74 @@
+import threading
+from flask import current_app
+from app import socketio
+from app import metrics
+from app.chat import codec
+
+
+class UnreadNotifier:
+    """
+    Coalesces unread badge updates. Counts are buffered per user and room
+    (the newest count wins) and each user gets at most one `unread_update`
+    per tick, carrying every room that changed: {'updates': [{room_id, count}]}.
+    A burst of messages in a large group costs one emit per member per tick
+    instead of one per member per message.
+    """
+
+    def __init__(self):
+        self.queued = 0
+        self.emitted = 0
+        self.emits_saved = 0
+        self._pending = {}
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._task = None
+        self._app = None
+
+    def add(self, room_id, rows):
+        """Queues (user_id, unread_count) rows, as returned by ChatParticipant.bump_unread."""
+        interval = current_app.config['UNREAD_FLUSH_INTERVAL']
+        with self._lock:
+            for user_id, count in rows:
+                self._pending.setdefault(user_id, {})[room_id] = count
+                self._pending_rows += 1
+            self.queued += len(rows)
+            if interval > 0 and self._task is None:
+                self._app = current_app._get_current_object()
+                self._task = socketio.start_background_task(self._run, interval)
+        if interval <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self.emitted += len(pending)
+            self.emits_saved += self._pending_rows - len(pending)
+            self._pending_rows = 0
+        for user_id, rooms in pending.items():
+            payload = {'updates': [{'room_id': room_id, 'count': count} for room_id, count in rooms.items()]}
+            if codec.subscriptions.uses_codec(compact=False):
+                socketio.emit('unread_update', payload, to=f"user_{user_id}")
+            if codec.subscriptions.uses_codec(compact=True):
+                socketio.emit('unread_update', codec.encode('unread_update', payload),
+                              to=codec.variant(f"user_{user_id}", True))
+
+    def _run(self, interval):
+        while True:
+            socketio.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self._app.logger.error(f"Error flushing unread updates: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'emitted': self.emitted,
+                'emits_saved': self.emits_saved,
+                'pending_users': len(self._pending),
+            }
+
+
+unread_notifier = UnreadNotifier()
+metrics.register('unread_updates', unread_notifier.stats)
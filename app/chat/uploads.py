@@ -0,0 +1,165 @@
+import hashlib
+import os
+import uuid
+from flask import current_app
+from app import db
+from app.models import ChatRoom, ChatMessage, ChatMessageAttachment, ChatParticipant, PendingUpload
+from app.chat.history import is_image_file
+from app.chat.unread import unread_notifier
+from app.chat.batching import message_batcher
+from app.chat.storage import file_sha256, store
+from app.chat.previews import request_preview, preview_info
+
+READ_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    """Rejected upload request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+    def response(self):
+        return {'error': str(self), **self.extra}, self.status
+
+
+def partial_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial', upload_id)
+
+
+def received_bytes(upload):
+    try:
+        return os.path.getsize(partial_path(upload.id))
+    except OSError:
+        return 0
+
+
+def begin_upload(user_id, room_id, filename, size, sha256=None):
+    """Registers a chunked upload and creates its empty partial file."""
+    if size < 0 or size > current_app.config['UPLOAD_MAX_BYTES']:
+        raise UploadError(f"File is too large (max {current_app.config['UPLOAD_MAX_BYTES']} bytes).", 413)
+    if sha256 is not None and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('sha256 must be 64 lowercase hex characters.')
+
+    upload = PendingUpload(id=uuid.uuid4().hex, user_id=user_id, room_id=room_id,
+                           filename=filename, size=size, sha256=sha256)
+    path = partial_path(upload.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length, chunk_sha256=None):
+    """
+    Streams one chunk from `stream` to the end of the partial file, in
+    READ_BLOCK pieces so memory stays flat. `offset` must equal the bytes
+    already received (otherwise 409 with the real offset, so the client can
+    resume from there). A chunk whose digest does not match `chunk_sha256`
+    is cut off again. Returns the new offset.
+    """
+    current = received_bytes(upload)
+    if offset != current:
+        raise UploadError('Offset does not match the bytes received.', 409, offset=current)
+    if length is None:
+        raise UploadError('Content-Length is required.', 411)
+    if length > current_app.config['UPLOAD_CHUNK_MAX_BYTES']:
+        raise UploadError(f"Chunk is too large (max {current_app.config['UPLOAD_CHUNK_MAX_BYTES']} bytes).", 413)
+    if offset + length > upload.size:
+        raise UploadError('Chunk runs past the declared file size.', 413)
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(partial_path(upload.id), 'r+b') as f:
+        f.seek(offset)
+        try:
+            while written < length:
+                block = stream.read(min(READ_BLOCK, length - written))
+                if not block:
+                    break
+                f.write(block)
+                digest.update(block)
+                written += len(block)
+            if written != length:
+                raise UploadError('Chunk ended early.', 400, offset=offset)
+            if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                raise UploadError('Chunk checksum mismatch.', 400, offset=offset)
+        except Exception:
+            # Keep the partial file exactly at the last good chunk
+            f.truncate(offset)
+            raise
+    return offset + written
+
+
+def finish_upload(upload, sender):
+    """Verifies a complete upload, moves it into the blob store and publishes it as a message."""
+    path = partial_path(upload.id)
+    received = received_bytes(upload)
+    if received != upload.size:
+        raise UploadError('Upload is incomplete.', 409, offset=received)
+    sha256 = file_sha256(path)
+    if upload.sha256 and sha256 != upload.sha256:
+        raise UploadError('File checksum mismatch.', 400)
+
+    sha256, file_path_relative_web = store(path, sha256)
+
+    room_id, filename, size = upload.room_id, upload.filename, upload.size
+    db.session.delete(upload)
+    return publish_attachment(room_id, sender, filename, file_path_relative_web, size, sha256)
+
+
+def cancel_upload(upload):
+    try:
+        os.remove(partial_path(upload.id))
+    except OSError:
+        pass
+    db.session.delete(upload)
+    db.session.commit()
+
+
+def publish_attachment(room_id, sender, filename, file_path_web, file_size, blob_sha256):
+    """
+    Creates the message and attachment rows for a file already in the blob
+    store, commits, then broadcasts the message and unread counts. Returns
+    the message payload.
+    """
+    new_message = ChatMessage(sender_id=sender.id, room_id=room_id, content=f"File: {filename}")
+    db.session.add(new_message)
+    db.session.flush()
+
+    # Save the WEB-FRIENDLY path to the database
+    attachment = ChatMessageAttachment(message_id=new_message.id, filename=filename,
+                                       file_path=file_path_web, file_size_bytes=file_size,
+                                       blob_sha256=blob_sha256)
+    db.session.add(attachment)
+    db.session.flush()  # Ensure attachment has an ID
+    ChatRoom.record_activity(room_id, new_message)
+    request_preview(attachment)
+
+    # 1. Update unread counts BEFORE committing
+    unread_rows = ChatParticipant.bump_unread(room_id, sender.id)
+
+    # 2. COMMIT all changes to the database
+    db.session.commit()
+
+    msg_data = {
+        'id': new_message.id,
+        'content': new_message.content,
+        'sender_name': sender.name,
+        'sender_id': sender.id,
+        'timestamp': new_message.timestamp.isoformat() + 'Z',
+        'attachment': {'id': attachment.id, 'filename': attachment.filename,
+                       'is_image': is_image_file(filename), 'viewed': attachment.viewed,
+                       'preview': preview_info(attachment)},
+        'is_forward': False
+    }
+
+    # 3. NOW broadcast the message. The attachment is safely in the DB.
+    message_batcher.publish(room_id, msg_data)
+
+    # 4. NOW broadcast the unread updates.
+    unread_notifier.add(room_id, unread_rows)
+    return msg_data
@@ -0,0 +1,63 @@
+"""
+Read/write routing between the primary database and an optional read replica.
+
+When READ_REPLICA_URL is set it becomes the 'replica' bind. Views decorated
+with @read_replica send their plain SELECTs there; everything else, and
+every query in undecorated views and Socket.IO handlers, uses the primary.
+Once a request writes (a flush, or an UPDATE/INSERT/DELETE statement) the
+rest of it reads from the primary too, so it always sees its own writes.
+"""
+from functools import wraps
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy import Select, TextClause
+
+REPLICA_BIND = 'replica'
+
+
+def _is_read(clause):
+    if isinstance(clause, Select):
+        return clause._for_update_arg is None
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return False
+
+
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and clause is not None:
+            if not _is_read(clause):
+                self.info['wrote'] = True
+            elif self.info.get('read_replica') and not self.info.get('wrote') \
+                    and REPLICA_BIND in self._db.engines:
+                engine = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+                # Only tables on the default bind are mirrored by the replica
+                if engine is self._db.engines.get(None):
+                    return self._db.engines[REPLICA_BIND]
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+
+def read_replica(view):
+    """Lets the view's reads go to the replica until it writes."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        current_app.extensions['sqlalchemy'].session.info['read_replica'] = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def replica_bind(config):
+    """SQLALCHEMY_BINDS entry for READ_REPLICA_URL, or None when no replica is configured."""
+    url = config['READ_REPLICA_URL']
+    if not url:
+        return None
+    from app import sqlite_profile
+    return {'url': url, **sqlite_profile.engine_options(config, url)}
@@ -0,0 +1,226 @@
+"""
+In-process background jobs, persisted in the job table.
+
+    @jobs.task('rooms.purge')
+    def purge_room(room_id): ...
+
+    jobs.enqueue('rooms.purge', room_id=room.id)   # commits with the caller's work
+    jobs.periodic('uploads.expire', 'ATTACHMENT_CLEANUP_INTERVAL')
+
+Each process runs one scheduler, started with its first request. Every
+JOBS_POLL_INTERVAL seconds it claims due jobs with a conditional UPDATE (so
+several processes can share the table) and runs at most JOBS_WORKERS of them
+at once as background tasks. A failing job is retried with exponential
+backoff from JOBS_RETRY_DELAY until its max_attempts. Tasks must be
+idempotent: a job left 'running' by a dead process is queued again after
+JOBS_STALE_AFTER seconds.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db, socketio
+from app import metrics
+from app.models import Job
+
+_tasks = {}     # name -> (function, max_attempts or None for JOBS_MAX_ATTEMPTS)
+_periodic = {}  # name -> interval in seconds, or the config key holding it
+
+
+def task(name, max_attempts=None):
+    """Registers the decorated function as the handler of jobs called `name`."""
+    def decorator(fn):
+        _tasks[name] = (fn, max_attempts)
+        return fn
+    return decorator
+
+
+def periodic(name, interval):
+    """Queues task `name` (without arguments) every `interval` seconds, unless one is still pending."""
+    _periodic[name] = interval
+
+
+def enqueue(name, delay=0, **payload):
+    """Adds a job to the current session; it is committed or rolled back with the caller's transaction."""
+    if name not in _tasks:
+        raise KeyError(f"Unknown job {name!r}")
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=_tasks[name][1] or current_app.config['JOBS_MAX_ATTEMPTS']
+    )
+    db.session.add(job)
+    return job
+
+
+class JobScheduler:
+    """Polls the job table and runs due jobs on a bounded set of background tasks."""
+
+    def __init__(self):
+        self.workers = 4
+        self.poll_interval = 1.0
+        self.retry_delay = 5.0
+        self.queue_depth = 0  # due jobs at the last poll
+        self.running = 0
+        self.claimed = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.run_ms_total = 0.0
+        self._next_periodic = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self._app = None
+
+    def start(self, app):
+        if self._task is not None or not app.config['JOBS_WORKERS']:
+            return
+        with self._lock:
+            if self._task is None:
+                self.workers = app.config['JOBS_WORKERS']
+                self.poll_interval = app.config['JOBS_POLL_INTERVAL']
+                self.retry_delay = app.config['JOBS_RETRY_DELAY']
+                self._app = app
+                self._task = socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.poll_interval)
+            try:
+                with self._app.app_context():
+                    self._queue_periodic()
+                    self._dispatch()
+            except Exception as e:
+                self._app.logger.error(f"Error in job scheduler: {e}")
+
+    def _queue_periodic(self):
+        now = time.monotonic()
+        queued = False
+        for name, interval in _periodic.items():
+            if now < self._next_periodic.get(name, 0):
+                continue
+            if isinstance(interval, str):
+                interval = current_app.config[interval]
+            self._next_periodic[name] = now + interval
+            pending = db.session.query(Job.id).filter(
+                Job.name == name, Job.status.in_(('queued', 'running'))
+            ).first()
+            if pending is None:
+                enqueue(name)
+                queued = True
+        if queued:
+            db.session.commit()
+
+    def _dispatch(self):
+        now = datetime.utcnow()
+        due = Job.query.filter(Job.status == 'queued', Job.run_at <= now)
+        self.queue_depth = due.count()
+        free = self.workers - self.running
+        if free <= 0 or not self.queue_depth:
+            return
+
+        claimed = []
+        for job_id, run_at in due.with_entities(Job.id, Job.run_at).order_by(Job.run_at, Job.id).limit(free):
+            won = Job.query.filter(Job.id == job_id, Job.status == 'queued').update({
+                Job.status: 'running',
+                Job.started_at: now,
+                Job.attempts: Job.attempts + 1
+            }, synchronize_session=False)
+            if won:
+                claimed.append(job_id)
+                self.claimed += 1
+                wait_ms = (now - run_at).total_seconds() * 1000
+                self.wait_ms_total += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        db.session.commit()
+
+        for job_id in claimed:
+            with self._lock:
+                self.running += 1
+            socketio.start_background_task(self._execute, job_id)
+
+    def _execute(self, job_id):
+        started = time.monotonic()
+        try:
+            with self._app.app_context():
+                job = db.session.get(Job, job_id)
+                try:
+                    handler = _tasks.get(job.name)
+                    if handler is None:
+                        raise LookupError(f"No task registered for {job.name!r}")
+                    handler[0](**json.loads(job.payload))
+                    job.status = 'done'
+                    job.finished_at = datetime.utcnow()
+                    job.last_error = None
+                    db.session.commit()
+                    self.completed += 1
+                except Exception as e:
+                    db.session.rollback()
+                    self._app.logger.error(f"Job {job_id} ({job.name}) failed: {e}")
+                    job.last_error = f"{type(e).__name__}: {e}"
+                    if job.attempts < job.max_attempts:
+                        job.status = 'queued'
+                        job.run_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+                        self.retried += 1
+                    else:
+                        job.status = 'failed'
+                        job.finished_at = datetime.utcnow()
+                        self.failed += 1
+                    db.session.commit()
+        except Exception as e:
+            self._app.logger.error(f"Error recording job {job_id}: {e}")
+        finally:
+            self.run_ms_total += (time.monotonic() - started) * 1000
+            with self._lock:
+                self.running -= 1
+
+    def stats(self):
+        finished = self.completed + self.failed + self.retried
+        return {
+            'queue_depth': self.queue_depth,
+            'running': self.running,
+            'workers': self.workers,
+            'claimed': self.claimed,
+            'completed': self.completed,
+            'failed': self.failed,
+            'retried': self.retried,
+            'avg_wait_ms': round(self.wait_ms_total / self.claimed, 1) if self.claimed else 0.0,
+            'max_wait_ms': round(self.wait_ms_max, 1),
+            'avg_run_ms': round(self.run_ms_total / finished, 1) if finished else 0.0,
+        }
+
+
+scheduler = JobScheduler()
+
+metrics.register('jobs', scheduler.stats)
+
+
+def init_app(app):
+    """Starts the scheduler with the app's first request, so CLI commands and migrations never run jobs."""
+    @app.before_request
+    def _start_jobs():
+        scheduler.start(app)
+
+
+# --- Housekeeping for the table itself
+
+@task('jobs.housekeeping')
+def housekeeping():
+    now = datetime.utcnow()
+    # Claimed by a process that died before finishing
+    Job.query.filter(
+        Job.status == 'running',
+        Job.started_at < now - timedelta(seconds=current_app.config['JOBS_STALE_AFTER'])
+    ).update({Job.status: 'queued', Job.run_at: now}, synchronize_session=False)
+    Job.query.filter(
+        Job.status.in_(('done', 'failed')),
+        Job.finished_at < now - timedelta(seconds=current_app.config['JOBS_RETENTION'])
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+periodic('jobs.housekeeping', 'JOBS_HOUSEKEEPING_INTERVAL')
@@ -0,0 +1,20 @@
+"""
+Process-local counters for the caches and batchers, served at /chat/metrics.
+Each component registers a callable returning a dict of its current numbers.
+"""
+import threading
+
+_sources = {}
+_lock = threading.Lock()
+
+
+def register(name, source):
+    """Exposes source() under name; registering the same name again replaces it."""
+    with _lock:
+        _sources[name] = source
+
+
+def snapshot():
+    with _lock:
+        sources = dict(_sources)
+    return {name: source() for name, source in sources.items()}
@@ -1,5 +1,10 @@
 import random
+import re
+import time
+import unicodedata
 from datetime import datetime, timezone, timedelta
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
 from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -45,6 +50,9 @@ class User(UserMixin, db.Model):
 
     # --- removed: devices relationship (E2EE feature) ---
 
+    # The group member picker pages through users by (name, id)
+    __table_args__ = (db.Index('ix_user_name_id', 'name', 'id'),)
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -83,6 +91,65 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
+# --------------------------------------------------------------------------
+# USER DIRECTORY SEARCH INDEX
+# --------------------------------------------------------------------------
+
+def normalize_search_text(value):
+    """Case- and accent-folds text so 'José' and 'jose' index the same way."""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def user_search_tokens(user):
+    """Every word a user can be found by: name words, username, email (and its local part), public ID."""
+    tokens = set(re.findall(r'\w+', normalize_search_text(user.name)))
+    for value in (user.username, user.email, user.public_id):
+        value = normalize_search_text(value)
+        if value:
+            tokens.add(value)
+    if user.email:
+        tokens.add(normalize_search_text(user.email.split('@')[0]))
+    return {t[:100] for t in tokens if t}
+
+
+class UserSearchToken(db.Model):
+    """
+    One row per (token, user). The primary key is a B-tree on token, so a
+    prefix search is an index range scan instead of a '%q%' table scan.
+    """
+    __tablename__ = 'user_search_token'
+
+    token = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+    def __repr__(self):
+        return f"<UserSearchToken {self.token!r} -> {self.user_id}>"
+
+
+_SEARCHABLE_USER_FIELDS = ('name', 'username', 'email', 'public_id')
+
+
+def _write_search_tokens(connection, user):
+    table = UserSearchToken.__table__
+    connection.execute(table.delete().where(table.c.user_id == user.id))
+    tokens = user_search_tokens(user)
+    if tokens:
+        connection.execute(table.insert(), [{'token': t, 'user_id': user.id} for t in tokens])
+
+
+@event.listens_for(User, 'after_insert')
+def _index_new_user(mapper, connection, user):
+    _write_search_tokens(connection, user)
+
+
+@event.listens_for(User, 'after_update')
+def _reindex_user(mapper, connection, user):
+    state = inspect(user)
+    if any(state.attrs[field].history.has_changes() for field in _SEARCHABLE_USER_FIELDS):
+        _write_search_tokens(connection, user)
+
+
 # --------------------------------------------------------------------------
 # CHAT ROOM SYSTEM
 # --------------------------------------------------------------------------
@@ -101,6 +168,32 @@ class ChatRoom(db.Model):
         'ChatMessage', back_populates='room', lazy='dynamic', cascade="all, delete-orphan"
     )
 
+    # Denormalized so the conversation list never has to scan chat_message.
+    # No FK on last_message_id: it would make chat_room <-> chat_message a cycle.
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_activity_at = db.Column(db.DateTime, nullable=True, default=lambda: datetime.utcnow())
+
+    last_message = db.relationship(
+        'ChatMessage', primaryjoin='foreign(ChatRoom.last_message_id) == ChatMessage.id', viewonly=True
+    )
+
+    __table_args__ = (db.Index('ix_chat_room_last_activity', 'last_activity_at', 'id'),)
+
+    @staticmethod
+    def record_activity(room_id, message):
+        """
+        Points the room at its newest message, inside the caller's transaction.
+        The message must be flushed. The pointer only ever moves forward, so
+        concurrent senders cannot leave an older message behind.
+        """
+        ChatRoom.query.filter(
+            ChatRoom.id == room_id,
+            db.or_(ChatRoom.last_message_id.is_(None), ChatRoom.last_message_id < message.id)
+        ).update({
+            ChatRoom.last_message_id: message.id,
+            ChatRoom.last_activity_at: message.timestamp
+        }, synchronize_session=False)
+
     def __repr__(self):
         return f"<ChatRoom {self.name or self.id}>"
 
@@ -116,7 +209,49 @@ class ChatParticipant(db.Model):
     user = db.relationship('User', back_populates='chat_participations')
     room = db.relationship('ChatRoom', back_populates='participants')
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'room_id', name='_user_room_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'room_id', name='_user_room_uc'),
+        db.Index('ix_chat_participant_room_user', 'room_id', 'user_id'),
+    )
+
+    @staticmethod
+    def clear_unread(room_id, user_id):
+        """
+        Resets one member's unread count with an UPDATE keyed on (room_id,
+        user_id), inside the caller's transaction. The row is never read
+        first, so this is safe in @read_replica views whose loaded rows may
+        lag the primary.
+        """
+        db.session.execute(
+            db.update(ChatParticipant).where(
+                ChatParticipant.room_id == room_id, ChatParticipant.user_id == user_id,
+                ChatParticipant.unread_count != 0
+            ).values(unread_count=0).execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def bump_unread(room_id, sender_id, n=1):
+        """
+        Adds n to every other member's unread count with one UPDATE, inside the
+        caller's transaction. The increment happens in SQL, so concurrent
+        senders cannot overwrite each other. Returns (user_id, unread_count)
+        rows for the new counts.
+        """
+        where = (ChatParticipant.room_id == room_id, ChatParticipant.user_id != sender_id)
+        stmt = db.update(ChatParticipant).where(*where).values(
+            unread_count=db.func.coalesce(ChatParticipant.unread_count, 0) + n
+        ).execution_options(synchronize_session=False)
+
+        if db.session.get_bind().dialect.update_returning:
+            return db.session.execute(
+                stmt.returning(ChatParticipant.user_id, ChatParticipant.unread_count)
+            ).all()
+
+        # No RETURNING: read back within the same transaction, which holds the row locks
+        db.session.execute(stmt)
+        return db.session.execute(
+            db.select(ChatParticipant.user_id, ChatParticipant.unread_count).where(*where)
+        ).all()
 
     def __repr__(self):
         return f"<ChatParticipant User={self.user_id} Room={self.room_id}>"
@@ -139,6 +274,9 @@ class ChatMessage(db.Model):
         'ChatMessageAttachment', back_populates='message', uselist=False, cascade="all, delete-orphan"
     )
 
+    # History pages are read newest-first per room, so keep them an index range scan
+    __table_args__ = (db.Index('ix_chat_message_room_timestamp_id', 'room_id', 'timestamp', 'id'),)
+
     def __repr__(self):
         return f"<ChatMessage {self.id} from User {self.sender_id}>"
 
@@ -152,8 +290,137 @@ class ChatMessageAttachment(db.Model):
     file_path = db.Column(db.String(512), nullable=False)  # relative path
     file_size_bytes = db.Column(db.Integer)
     viewed = db.Column(db.Boolean, default=False)
+    viewed_at = db.Column(db.DateTime, nullable=True, index=True)  # when the view-once download was served
+    # Stored content; NULL for files uploaded before the blob store (they keep <room>/<name>)
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('attachment_blob.sha256'), nullable=True, index=True)
 
     message = db.relationship('ChatMessage', back_populates='attachment')
+    blob = db.relationship('AttachmentBlob')
 
     def __repr__(self):
         return f"<Attachment {self.filename} ({self.file_size_bytes} bytes)>"
+
+
+class AttachmentBlob(db.Model):
+    """
+    One stored file, named by its content (UPLOAD_FOLDER/blobs/ab/<sha256>).
+    `ref_count` is the number of attachment rows pointing at it; it is kept
+    by app.chat.storage, which deletes the row and the file at zero.
+    Images also get a thumbnail (UPLOAD_FOLDER/derivatives/ab/<sha256>.jpg)
+    and a BlurHash placeholder from app.chat.previews.
+    """
+    __tablename__ = 'attachment_blob'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    preview_status = db.Column(db.String(10), nullable=True)  # NULL (none yet), 'ready' or 'failed'
+    preview_width = db.Column(db.Integer, nullable=True)  # thumbnail size
+    preview_height = db.Column(db.Integer, nullable=True)
+    blurhash = db.Column(db.String(64), nullable=True)
+
+    def __repr__(self):
+        return f"<AttachmentBlob {self.sha256[:12]} x{self.ref_count}>"
+
+
+class PendingUpload(db.Model):
+    """
+    An attachment being uploaded in chunks. The bytes received so far live in
+    UPLOAD_FOLDER/.partial/<id>; the file's length is the resume offset.
+    """
+    __tablename__ = 'pending_upload'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    room_id = db.Column(db.Integer, db.ForeignKey('chat_room.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)  # expected digest, if the client sent one
+    created_at = db.Column(db.DateTime, default=lambda: datetime.utcnow(), index=True)
+
+    def __repr__(self):
+        return f"<PendingUpload {self.id} {self.filename} ({self.size} bytes)>"
+
+
+class Job(db.Model):
+    """
+    A unit of background work for app.jobs: `name` selects the registered
+    task, `payload` is its JSON keyword arguments. Queued jobs run once
+    `run_at` has passed; failures are retried with backoff until
+    `max_attempts`, then left as 'failed' with the last error.
+    """
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.utcnow())
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.utcnow())
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    # The scheduler polls for due work: WHERE status = 'queued' AND run_at <= now ORDER BY run_at
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.name} {self.status}>"
+
+
+class CacheVersion(db.Model):
+    """
+    Shared version stamps for the in-process caches. A process bumps a stamp
+    in the same transaction as the change it makes; the others compare it
+    with the stamp they last saw and drop their cached copies when it moved.
+    """
+    __tablename__ = 'cache_version'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def read(name):
+        return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+
+    @staticmethod
+    def bump(connection, name):
+        """
+        Moves stamp `name` forward inside the caller's transaction. On SQLite
+        and PostgreSQL this is one upsert, so two processes bumping a name
+        that has no row yet cannot fail on the same INSERT.
+        """
+        table = CacheVersion.__table__
+        upsert = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}.get(connection.dialect.name)
+        if upsert is not None:
+            connection.execute(upsert(table).values(name=name, version=1).on_conflict_do_update(
+                index_elements=[table.c.name], set_={'version': table.c.version + 1}
+            ))
+            return
+        updated = connection.execute(
+            table.update().where(table.c.name == name).values(version=table.c.version + 1)
+        ).rowcount
+        if not updated:
+            connection.execute(table.insert().values(name=name, version=1))
+
+    @staticmethod
+    def check(watcher, name):
+        """
+        Re-reads stamp `name` for a cache that follows it, at most every
+        `watcher.check_interval` seconds (0 = every call). The watcher keeps
+        `version`, `checked_at` and `version_checks`. Returns True when the
+        stamp moved since the watcher last read it; the first read only
+        records it.
+        """
+        now = time.monotonic()
+        if watcher.version is not None and now - watcher.checked_at < watcher.check_interval:
+            return False
+        watcher.checked_at = now
+        watcher.version_checks += 1
+        version = CacheVersion.read(name)
+        moved = watcher.version is not None and version != watcher.version
+        watcher.version = version
+        return moved
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import threading
+import time
+
+import socketio
+from engineio import json
+
+
+class SQLiteQueueManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager that fans events out through a shared SQLite file.
+
+    Every process appends published events to one table and polls it for rows
+    written by the others. It needs no broker, so it is meant for tests, local
+    multi-worker runs and single-host deployments; use Redis or another real
+    message queue across hosts.
+
+    URL format: ``sqlite:////absolute/path/to/queue.db``
+    """
+    name = 'sqlite'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None,
+                 poll_interval=0.01, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = url[len('sqlite:///'):]
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        self._last_prune = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS socketio_queue ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+            'created REAL NOT NULL, payload TEXT NOT NULL)'
+        )
+
+    def _connection(self):
+        # One connection per thread; sqlite3 connections are not shareable
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _publish(self, data):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            'INSERT INTO socketio_queue (channel, created, payload) VALUES (?, ?, ?)',
+            (self.channel, now, json.dumps(data))
+        )
+        # Every listener reads new rows within milliseconds, so old rows are garbage
+        if now - self._last_prune > self.retention:
+            self._last_prune = now
+            conn.execute('DELETE FROM socketio_queue WHERE created < ?', (now - self.retention,))
+
+    def _listen(self):
+        conn = self._connection()
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_queue').fetchone()[0]
+        while True:
+            rows = conn.execute(
+                'SELECT id, payload FROM socketio_queue WHERE channel = ? AND id > ? ORDER BY id',
+                (self.channel, last_id)
+            ).fetchall()
+            for row_id, payload in rows:
+                last_id = row_id
+                yield payload
+            if not rows:
+                self.server.sleep(self.poll_interval)
+
+
+def client_manager_options(config):
+    """
+    Keyword arguments for socketio.init_app() from SOCKETIO_MESSAGE_QUEUE.
+
+    No URL keeps the in-memory manager (single process). ``sqlite:///`` URLs use
+    SQLiteQueueManager; anything else (redis://, kafka://, zmq+tcp://, amqp://)
+    is handed to Flask-SocketIO, which picks the matching python-socketio manager.
+    """
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL') or 'flask-socketio'
+    if not url:
+        return {}
+    if url.startswith('sqlite:///'):
+        return {'client_manager': SQLiteQueueManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
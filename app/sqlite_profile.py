@@ -0,0 +1,63 @@
+"""
+SQLite tuning for the app's engines, selected with SQLITE_PROFILE.
+
+'tuned' (the default) puts the database in WAL mode so readers never block
+the writer, relaxes fsyncs to synchronous=NORMAL (safe in WAL), waits for
+locks instead of failing with "database is locked", and gives each
+connection a larger page cache and a memory-mapped read path. 'off' leaves
+SQLite's defaults alone.
+
+busy_timeout waits inside the SQLite C library, which also blocks the
+eventlet hub. Keep write transactions short; the pool settings below let
+green threads queue for a connection instead of opening an unbounded number.
+"""
+from sqlalchemy import event
+
+
+def is_sqlite_file(uri):
+    return uri.startswith('sqlite:') and uri not in ('sqlite://', 'sqlite:///:memory:') \
+        and 'mode=memory' not in uri
+
+
+def engine_options(config, uri=None):
+    """Engine options for the profile (default: the primary URI); empty when it does not apply."""
+    if config['SQLITE_PROFILE'] != 'tuned' or not is_sqlite_file(uri or config['SQLALCHEMY_DATABASE_URI']):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        # Pooled connections move between (green) threads
+        'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0, 'check_same_thread': False},
+    }
+
+
+def pragmas(config):
+    return [
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+    ]
+
+
+def install(engine, config):
+    """Runs the profile's PRAGMAs on every new connection of a SQLite engine."""
+    if config['SQLITE_PROFILE'] != 'tuned' or engine.dialect.name != 'sqlite':
+        return
+    statements = pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
+def init_app(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            install(engine, app.config)
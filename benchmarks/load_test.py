@@ -0,0 +1,202 @@
+"""
+End-to-end load test of the production launch mode (serve.py).
+
+For every worker count, starts serve.py with that many gunicorn instances
+against a scratch database, logs in --clients users over HTTP, connects each
+one over Socket.IO (pinned to one backend, like a sticky balancer would) and
+has them all chat in one group room for --duration seconds. Reports sent and
+delivered messages per second and delivery latency percentiles.
+
+Needs the Socket.IO client extras: pip install "python-socketio[client]"
+
+    python benchmarks/load_test.py --workers 1 2 4 --clients 40 --duration 15
+    python benchmarks/load_test.py --url http://127.0.0.1:8080 --database-url sqlite:////srv/app.db
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, basedir)
+
+import requests  # noqa: E402
+import socketio  # noqa: E402
+
+PASSWORD = 'load-test-password'
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def seed(database_url, clients):
+    """Create (or reuse) verified load-test users sharing one group room."""
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app, db
+    from app.models import User, ChatRoom, ChatParticipant
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        users = []
+        for i in range(clients):
+            email = f"loadtest{i}@example.com"
+            user = User.query.filter_by(email=email).first()
+            if user is None:
+                user = User(username=f"loadtest{i}", email=email, name=f"Load Test {i}",
+                            is_verified=True, is_active=True)
+                user.set_password(PASSWORD)
+                db.session.add(user)
+            users.append(user)
+        room = ChatRoom.query.filter_by(name='Load test', room_type='group').first()
+        if room is None:
+            room = ChatRoom(name='Load test', room_type='group')
+            db.session.add(room)
+        db.session.flush()
+        member_ids = {p.user_id for p in room.participants}
+        for user in users:
+            if user.id not in member_ids:
+                db.session.add(ChatParticipant(user_id=user.id, room_id=room.id))
+        db.session.commit()
+        return [u.email for u in users], room.id
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not come up")
+
+
+class LoadClient:
+    def __init__(self, index, base_url, email, room_id, transports):
+        self.index = index
+        self.base_url = base_url
+        self.room_id = room_id
+        self.http = requests.Session()
+        page = self.http.get(f"{base_url}/auth/login")
+        token = CSRF_RE.search(page.text).group(1)
+        resp = self.http.post(f"{base_url}/auth/login", allow_redirects=False,
+                              data={'csrf_token': token, 'email': email, 'password': PASSWORD})
+        if resp.status_code != 302 or 'login' in resp.headers.get('Location', ''):
+            raise RuntimeError(f"Login failed for {email}")
+
+        self.latencies = []
+        self.sent = 0
+        self.sio = socketio.Client(http_session=self.http, reconnection=False)
+        self.sio.on('message', self.on_message)
+        self.sio.connect(base_url, transports=transports, wait_timeout=10)
+        self.sio.emit('join', {'room': str(room_id)})
+
+    def on_message(self, data):
+        content = data.get('content') or ''
+        if content.startswith('lt|'):
+            self.latencies.append(time.time() - float(content.split('|')[2]))
+
+    def run(self, rate, stop_at):
+        interval = 1.0 / rate
+        next_send = time.time()
+        while time.time() < stop_at:
+            self.sio.emit('send_message', {'room': self.room_id,
+                                           'message': f"lt|{self.index}|{time.time():.6f}"})
+            self.sent += 1
+            next_send += interval
+            time.sleep(max(0, next_send - time.time()))
+
+    def close(self):
+        self.sio.disconnect()
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_round(urls, emails, room_id, args):
+    clients = [LoadClient(i, urls[i % len(urls)], email, room_id, args.transports)
+               for i, email in enumerate(emails)]
+    time.sleep(1)  # let joins settle on every backend
+
+    started = time.time()
+    stop_at = started + args.duration
+    threads = [threading.Thread(target=c.run, args=(args.rate, stop_at)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(args.drain)
+    elapsed = time.time() - started
+
+    for c in clients:
+        c.close()
+    latencies = [lat for c in clients for lat in c.latencies]
+    sent = sum(c.sent for c in clients)
+    return {
+        'sent_per_sec': sent / args.duration,
+        'delivered_per_sec': len(latencies) / elapsed,
+        'delivered_ratio': len(latencies) / max(1, sent * len(clients)),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def spawn(workers, base_port, database_url, queue_url):
+    env = dict(os.environ, DATABASE_URL=database_url, GUNICORN_ACCESS_LOG='/dev/null')
+    if workers > 1:
+        env['SOCKETIO_MESSAGE_QUEUE'] = queue_url
+    proc = subprocess.Popen([sys.executable, os.path.join(basedir, 'serve.py'),
+                             '--workers', str(workers), '--base-port', str(base_port)],
+                            cwd=basedir, env=env)
+    ports = [base_port + i for i in range(workers)]
+    for port in ports:
+        wait_for_port(port)
+    return proc, [f"http://127.0.0.1:{port}" for port in ports]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=2.0, help='messages per second per client')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--drain', type=float, default=2.0, help='seconds to wait for in-flight deliveries')
+    parser.add_argument('--base-port', type=int, default=5100)
+    parser.add_argument('--transports', nargs='+', default=['websocket'], help='e.g. polling websocket')
+    parser.add_argument('--url', nargs='+', help='test running server(s) instead of spawning serve.py')
+    parser.add_argument('--database-url', help='database the server(s) use (default: a scratch sqlite file)')
+    parser.add_argument('--queue', help='SOCKETIO_MESSAGE_QUEUE for spawned servers (default: scratch sqlite queue)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='vizzchat-load-')
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tmpdir, 'app.db')
+    queue_url = args.queue or 'sqlite:///' + os.path.join(tmpdir, 'socketio-queue.db')
+    emails, room_id = seed(database_url, args.clients)
+
+    rounds = [('external', args.url)] if args.url else [(n, None) for n in args.workers]
+    print(f"{args.clients} clients x {args.rate:g} msg/s for {args.duration:g}s, transports={args.transports}")
+    print(f"{'workers':>8} {'sent/s':>10} {'delivered/s':>12} {'delivered':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for workers, urls in rounds:
+        proc = None
+        if urls is None:
+            proc, urls = spawn(workers, args.base_port, database_url, queue_url)
+        try:
+            r = run_round(urls, emails, room_id, args)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+        print(f"{workers:>8} {r['sent_per_sec']:>10.0f} {r['delivered_per_sec']:>12.0f} "
+              f"{r['delivered_ratio']:>9.1%} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
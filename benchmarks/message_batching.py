@@ -0,0 +1,128 @@
+"""
+Outbound message frames in one busy room: per-message `message` frames vs.
+batched `message_batch` frames.
+
+--senders members send --rate messages a second each for --duration
+seconds through the real send_message handler. --members listeners join
+per message and as many again join with batch=true; every frame each
+group receives is counted and sized as the JSON text of its Socket.IO
+event, so the numbers are per listener and comparable.
+
+    python benchmarks/message_batching.py --senders 20 --rate 5 --members 20
+    python benchmarks/message_batching.py --interval 0.2
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db, socketio  # noqa: E402
+from app.models import User, ChatRoom, ChatParticipant  # noqa: E402
+
+
+def build_app(args):
+    tmpdir = tempfile.mkdtemp(prefix='vizzchat-batching-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmpdir, 'app.db')
+        WTF_CSRF_ENABLED = False
+        MESSAGE_BATCH_INTERVAL = args.interval
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f"batch{i}", email=f"batch{i}@example.com", name=f"Batch User {i}",
+                      is_verified=True, is_active=True) for i in range(args.senders + 2 * args.members)]
+        room = ChatRoom(name='Busy', room_type='group')
+        db.session.add_all(users + [room])
+        db.session.flush()
+        db.session.add_all(ChatParticipant(user_id=u.id, room_id=room.id) for u in users)
+        db.session.commit()
+        return app, [u.id for u in users], str(room.id)
+
+
+def connect(app, user_id):
+    http = app.test_client()
+    with http.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return socketio.test_client(app, flask_test_client=http)
+
+
+def tally(clients, name, totals):
+    for client in clients:
+        for event in client.get_received():
+            if event['name'] == name:
+                # send() arrives as the bare payload, emit() as a list of arguments
+                args = event['args'] if isinstance(event['args'], list) else [event['args']]
+                totals['frames'] += 1
+                totals['bytes'] += len(json.dumps([name] + args, separators=(',', ':')))
+                totals['messages'] += len(args[0]['id']) if name == 'message_batch' else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--senders', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=5.0, help='messages a second per sender')
+    parser.add_argument('--members', type=int, default=20, help='listeners per delivery mode')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--interval', type=float, default=Config.MESSAGE_BATCH_INTERVAL,
+                        help='MESSAGE_BATCH_INTERVAL for the run')
+    args = parser.parse_args()
+
+    app, user_ids, room = build_app(args)
+    senders = [connect(app, user_id) for user_id in user_ids[:args.senders]]
+    listeners = [connect(app, user_id) for user_id in user_ids[args.senders:]]
+    per_message, batched = listeners[:args.members], listeners[args.members:]
+    for client in senders + per_message:
+        client.emit('join', {'room': room})
+    for client in batched:
+        client.emit('join', {'room': room, 'batch': True})
+    for client in senders + listeners:
+        client.get_received()
+
+    def send_at_rate(client, index):
+        interval = 1.0 / args.rate
+        next_send = time.time() + index * interval / args.senders
+        stop_at = time.time() + args.duration
+        i = 0
+        while time.time() < stop_at:
+            eventlet.sleep(max(0, next_send - time.time()))
+            client.emit('send_message', {'room': room, 'message': f"message {i} from sender {index}"})
+            i += 1
+            next_send += interval
+
+    totals = {mode: {'frames': 0, 'bytes': 0, 'messages': 0} for mode in ('message', 'message_batch')}
+    started = time.perf_counter()
+    pool = eventlet.GreenPool()
+    for index, client in enumerate(senders):
+        pool.spawn(send_at_rate, client, index)
+    while pool.running():
+        tally(per_message, 'message', totals['message'])
+        tally(batched, 'message_batch', totals['message_batch'])
+        eventlet.sleep(0.01)
+    eventlet.sleep(max(0.1, 2 * args.interval))
+    tally(per_message, 'message', totals['message'])
+    tally(batched, 'message_batch', totals['message_batch'])
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.senders} senders x {args.rate:g} msgs/s for {args.duration:g}s, "
+          f"batch interval {args.interval * 1000:g} ms; per listener:")
+    print(f"{'mode':>14} {'messages':>9} {'frames/s':>9} {'bytes/s':>10} {'bytes/msg':>10}")
+    for label, name in (('per-message', 'message'), ('batched', 'message_batch')):
+        t = totals[name]
+        messages = t['messages'] / args.members
+        print(f"{label:>14} {messages:>9.0f} {t['frames'] / args.members / elapsed:>9.1f} "
+              f"{t['bytes'] / args.members / elapsed:>10.0f} {t['bytes'] / max(1, t['messages']):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
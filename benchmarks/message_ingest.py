@@ -0,0 +1,119 @@
+"""
+send_message throughput: per-message commit vs. write-behind group commit.
+
+Runs the real Socket.IO handlers against a scratch SQLite file, one
+subprocess per mode. --senders green threads each send --messages messages
+into --rooms group rooms, and one listener per room counts broadcasts.
+Throughput is messages committed and delivered per second.
+
+    python benchmarks/message_ingest.py --senders 50 --messages 40 --rooms 5
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import subprocess  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db, socketio  # noqa: E402
+from app.models import User, ChatRoom, ChatParticipant, ChatMessage  # noqa: E402
+
+
+def build_app(ingest, args):
+    tmpdir = tempfile.mkdtemp(prefix='vizzchat-ingest-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmpdir, 'app.db')
+        WTF_CSRF_ENABLED = False
+        MESSAGE_INGEST_ENABLED = ingest
+        MESSAGE_INGEST_BATCH_SIZE = args.batch_size
+        MESSAGE_INGEST_MAX_DELAY_MS = args.max_delay_ms
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f"bench{i}", email=f"bench{i}@example.com", name=f"Bench {i}",
+                      is_verified=True, is_active=True) for i in range(args.senders + args.rooms)]
+        db.session.add_all(users)
+        rooms = [ChatRoom(name=f"Bench {r}", room_type='group') for r in range(args.rooms)]
+        db.session.add_all(rooms)
+        db.session.flush()
+        for r, room in enumerate(rooms):
+            members = users[r:args.senders:args.rooms] + [users[args.senders + r]]
+            db.session.add_all(ChatParticipant(user_id=u.id, room_id=room.id) for u in members)
+        db.session.commit()
+        return app, [u.id for u in users], [r.id for r in rooms]
+
+
+def connect(app, user_id):
+    http = app.test_client()
+    with http.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return socketio.test_client(app, flask_test_client=http)
+
+
+def run(ingest, args):
+    app, user_ids, room_ids = build_app(ingest, args)
+    senders = [(connect(app, user_ids[i]), room_ids[i % args.rooms]) for i in range(args.senders)]
+    listeners = [connect(app, user_ids[args.senders + r]) for r in range(args.rooms)]
+    for client, room_id in zip(listeners, room_ids):
+        client.emit('join', {'room': str(room_id)})
+        client.get_received()
+
+    expected = args.senders * args.messages
+    delivered = 0
+
+    def send_all(client, room_id):
+        for i in range(args.messages):
+            client.emit('send_message', {'room': room_id, 'message': f"bench {i}"})
+
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(args.senders)
+    for client, room_id in senders:
+        pool.spawn(send_all, client, room_id)
+    pool.waitall()
+    while delivered < expected:
+        for client in listeners:
+            delivered += sum(1 for e in client.get_received() if e['name'] == 'message')
+        socketio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        stored = db.session.query(ChatMessage).count()
+    assert stored == expected, (stored, expected)
+    return expected / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--senders', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=40, help='messages per sender')
+    parser.add_argument('--rooms', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--max-delay-ms', type=int, default=5)
+    parser.add_argument('--mode', choices=['per-message', 'group'],
+                        help='run one mode in this process (Flask-SocketIO keeps one server per process)')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(run(args.mode == 'group', args))
+        return
+
+    per_message, group = (
+        float(subprocess.check_output([sys.executable, __file__, '--mode', mode] + sys.argv[1:]).split()[-1])
+        for mode in ('per-message', 'group')
+    )
+    print(f"{args.senders} senders x {args.messages} messages into {args.rooms} rooms")
+    print(f"per-message commit: {per_message:8.0f} msgs/s")
+    print(f"group commit:       {group:8.0f} msgs/s  ({group / per_message:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Serialization cost of the realtime hot paths: the `message` broadcast and
+the `unread_update` badge event, with full JSON keys or the short field
+codes of app/chat/codec.py, over the JSON and msgpack Socket.IO packets.
+
+Each case encodes the event the way the server does for one emit (field
+codes included) --iterations times; CPU is microseconds per encode and
+bandwidth is the bytes of the encoded packet.
+
+    python benchmarks/realtime_codec.py --iterations 20000 --rooms 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet  # noqa: E402
+from app.chat import codec  # noqa: E402
+
+try:
+    from socketio.msgpack_packet import MsgPackPacket
+except ImportError:  # msgpack is optional
+    MsgPackPacket = None
+
+
+def sample_payloads(rooms):
+    message = {
+        'id': 184467,
+        'content': 'Sounds good, see you at the standup tomorrow morning',
+        'sender_name': 'Priya Raman',
+        'sender_id': 1042,
+        'timestamp': '2024-05-14T09:31:07.412345Z',
+        'attachment': None,
+        'is_forward': False,
+    }
+    with_attachment = dict(message, content='File: report.png', attachment={
+        'id': 9081, 'filename': 'report.png', 'is_image': True, 'viewed': False,
+        'preview': {'width': 320, 'height': 180, 'blurhash': 'LEHV6nWB2yk8pyo0adR*.7kCMdnj'},
+    })
+    unread = {'updates': [{'room_id': 500 + i, 'count': 3 + i} for i in range(rooms)]}
+    return [('message', 'message', message),
+            ('message+attachment', 'message', with_attachment),
+            (f'unread_update x{rooms}', 'unread_update', unread)]
+
+
+def measure(packet_class, event, payload, compact, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        data = codec.encode(event, payload) if compact else payload
+        encoded = packet_class(packet.EVENT, data=[event, data], namespace='/').encode()
+    elapsed = time.perf_counter() - started
+    return elapsed / iterations * 1e6, len(encoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--rooms', type=int, default=5, help='rooms in one unread_update')
+    args = parser.parse_args()
+
+    serializers = [('json', packet.Packet)]
+    if MsgPackPacket is not None:
+        serializers.append(('msgpack', MsgPackPacket))
+    else:
+        print('msgpack not installed; JSON only')
+
+    print(f"{'payload':>22} {'serializer':>10} {'keys':>8} {'us/encode':>10} {'bytes':>6} {'vs json':>8}")
+    for label, event, payload in sample_payloads(args.rooms):
+        baseline = None
+        for name, packet_class in serializers:
+            for compact in (False, True):
+                us, size = measure(packet_class, event, payload, compact, args.iterations)
+                baseline = baseline or size
+                print(f"{label:>22} {name:>10} {'codes' if compact else 'full':>8} "
+                      f"{us:>10.2f} {size:>6} {size / baseline:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
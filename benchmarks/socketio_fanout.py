@@ -0,0 +1,100 @@
+"""
+Socket.IO fan-out throughput across N worker processes.
+
+Every worker runs a python-socketio server on the configured client manager
+and emits its share of the messages to a room; every worker counts the
+events it receives from the others through the queue. Throughput is the
+total number of cross-process deliveries per second.
+
+    python benchmarks/socketio_fanout.py --workers 1 2 4 --messages 5000
+    python benchmarks/socketio_fanout.py --queue redis://localhost:6379/0
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio  # noqa: E402
+from app.socketio_queue import SQLiteQueueManager  # noqa: E402
+
+
+def make_manager(url, channel):
+    if url.startswith('sqlite:///'):
+        return SQLiteQueueManager(url, channel=channel)
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager(url, channel=channel)
+    return socketio.KombuManager(url, channel=channel)
+
+
+def worker(url, channel, index, workers, messages, ready, start, done):
+    manager = make_manager(url, channel)
+    received = multiprocessing.Value('i', 0, lock=False)
+    expected = (messages // workers) * (workers - 1)
+
+    original = manager._handle_emit
+
+    def counting_handle_emit(message):
+        if message.get('host_id') != manager.host_id:
+            received.value += 1
+        original(message)
+
+    manager._handle_emit = counting_handle_emit
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+    server.manager_initialized = True
+    manager.initialize()
+
+    ready.wait()
+    start.wait()
+    for i in range(messages // workers):
+        server.emit('message', {'id': i, 'worker': index, 'content': 'x' * 64}, to='1')
+
+    deadline = time.time() + 60
+    while received.value < expected and time.time() < deadline:
+        time.sleep(0.005)
+    done.put(received.value)
+
+
+def run(url, channel, workers, messages):
+    ready = multiprocessing.Barrier(workers + 1)
+    start = multiprocessing.Event()
+    done = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=worker, args=(url, channel, i, workers, messages, ready, start, done))
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    ready.wait()
+    time.sleep(0.2)  # let every listener reach its poll loop
+
+    t0 = time.perf_counter()
+    start.set()
+    delivered = sum(done.get() for _ in procs)
+    elapsed = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+    return delivered, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queue', help='message queue URL (default: temporary SQLite queue)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--messages', type=int, default=4000, help='messages emitted per run, split across workers')
+    args = parser.parse_args()
+
+    url = args.queue or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'queue.db')
+    print(f"queue: {url}")
+    print(f"{'workers':>8} {'emitted':>8} {'delivered':>10} {'seconds':>8} {'deliveries/s':>13}")
+    for n in args.workers:
+        delivered, elapsed = run(url, f'bench-{n}-{time.time()}', n, args.messages)
+        emitted = (args.messages // n) * n
+        print(f"{n:>8} {emitted:>8} {delivered:>10} {elapsed:>8.2f} {delivered / elapsed:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
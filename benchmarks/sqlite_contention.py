@@ -0,0 +1,110 @@
+"""
+SQLite read/write contention with and without the 'tuned' profile.
+
+Writer threads insert messages and commit (like send_message); reader
+threads page through a room's history (like view_room). Each profile runs
+for --duration seconds on a fresh database file and reports completed reads
+and writes per second and how many operations failed with "database is
+locked".
+
+    python benchmarks/sqlite_contention.py --readers 8 --writers 4 --duration 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from config import Config  # noqa: E402
+from app import sqlite_profile  # noqa: E402
+
+SCHEMA = (
+    'CREATE TABLE chat_message (id INTEGER PRIMARY KEY, room_id INTEGER NOT NULL, '
+    'sender_id INTEGER NOT NULL, content TEXT, timestamp REAL NOT NULL)',
+    'CREATE INDEX ix_room_ts ON chat_message (room_id, timestamp, id)',
+)
+
+
+def make_engine(profile, path):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update(SQLITE_PROFILE=profile, SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+    engine = create_engine(config['SQLALCHEMY_DATABASE_URI'], **sqlite_profile.engine_options(config))
+    sqlite_profile.install(engine, config)
+    return engine
+
+
+def run(profile, args):
+    path = os.path.join(tempfile.mkdtemp(prefix='vizzchat-sqlite-'), 'bench.db')
+    engine = make_engine(profile, path)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text('INSERT INTO chat_message (room_id, sender_id, content, timestamp) VALUES '
+                          + ', '.join(f"({i % args.rooms}, 1, 'seed {i}', {i})" for i in range(args.seed))))
+
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    stop_at = time.time() + args.duration
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(index):
+        n = 0
+        while time.time() < stop_at:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text('INSERT INTO chat_message (room_id, sender_id, content, timestamp) '
+                                      'VALUES (:r, :s, :c, :t)'),
+                                 {'r': n % args.rooms, 's': index, 'c': f"message {n}", 't': time.time()})
+                bump('writes')
+            except OperationalError:
+                bump('locked')
+            n += 1
+
+    def reader(index):
+        n = 0
+        while time.time() < stop_at:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT id, content FROM chat_message WHERE room_id = :r '
+                                      'ORDER BY timestamp DESC, id DESC LIMIT 50'), {'r': n % args.rooms}).all()
+                bump('reads')
+            except OperationalError:
+                bump('locked')
+            n += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    return {key: value / args.duration if key != 'locked' else value for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=20000, help='messages inserted before the run')
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.duration:g}s per profile")
+    print(f"{'profile':>8} {'reads/s':>10} {'writes/s':>10} {'locked':>8}")
+    for profile in ('off', 'tuned'):
+        r = run(profile, args)
+        print(f"{profile:>8} {r['reads']:>10.0f} {r['writes']:>10.0f} {r['locked']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Typing-indicator traffic in one group room, before and after server-side
+coalescing.
+
+--typists members type in bursts (a keystroke every --keystroke-ms for
+--burst seconds, then a pause) while every member has the room open. The
+new path is measured: the throttled client logic from room.html drives the
+real handlers and every typing_update frame received by any member is
+counted. The legacy number is computed from the same keystroke trace: one
+start_typing per keystroke and one stop_typing per pause, each broadcast
+to every other member.
+
+    python benchmarks/typing_volume.py --members 50 --typists 5 --duration 10
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db, socketio  # noqa: E402
+from app.models import User, ChatRoom, ChatParticipant  # noqa: E402
+
+TYPING_REFRESH = 3.0  # matches room.html
+TYPING_IDLE = 2.0
+
+
+def build_app(args):
+    tmpdir = tempfile.mkdtemp(prefix='vizzchat-typing-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmpdir, 'app.db')
+        WTF_CSRF_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f"typist{i}", email=f"typist{i}@example.com", name=f"Typist {i}",
+                      is_verified=True, is_active=True) for i in range(args.members)]
+        room = ChatRoom(name='Typing', room_type='group')
+        db.session.add_all(users + [room])
+        db.session.flush()
+        db.session.add_all(ChatParticipant(user_id=u.id, room_id=room.id) for u in users)
+        db.session.commit()
+        return app, [u.id for u in users], str(room.id)
+
+
+def connect(app, user_id):
+    http = app.test_client()
+    with http.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return socketio.test_client(app, flask_test_client=http)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--typists', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--keystroke-ms', type=int, default=150)
+    parser.add_argument('--burst', type=float, default=4.0, help='seconds of typing before each pause')
+    parser.add_argument('--pause', type=float, default=3.0)
+    args = parser.parse_args()
+
+    app, user_ids, room = build_app(args)
+    clients = [connect(app, user_id) for user_id in user_ids]
+    for client in clients:
+        client.emit('join', {'room': room})
+        client.get_received()
+
+    legacy = {'events': 0}
+    sent = {'events': 0}
+
+    def type_in_bursts(client):
+        stop_at = time.time() + args.duration
+        while time.time() < stop_at:
+            last_sent = 0
+            burst_end = time.time() + args.burst
+            while time.time() < min(burst_end, stop_at):
+                legacy['events'] += 1
+                now = time.time()
+                if now - last_sent > TYPING_REFRESH:
+                    last_sent = now
+                    client.emit('start_typing', {'room': room})
+                    sent['events'] += 1
+                eventlet.sleep(args.keystroke_ms / 1000.0)
+            # idle timer fires
+            eventlet.sleep(TYPING_IDLE)
+            client.emit('stop_typing', {'room': room})
+            sent['events'] += 1
+            legacy['events'] += 1
+            eventlet.sleep(max(0, args.pause - TYPING_IDLE))
+
+    pool = eventlet.GreenPool()
+    for client in clients[:args.typists]:
+        pool.spawn(type_in_bursts, client)
+    pool.waitall()
+    eventlet.sleep(1)
+
+    frames = sum(1 for client in clients for e in client.get_received() if e['name'] == 'typing_update')
+    legacy_frames = legacy['events'] * (args.members - 1)
+    print(f"{args.members} members, {args.typists} typing for {args.duration:g}s")
+    print(f"legacy:    {legacy['events']:6} client events -> {legacy_frames:8} frames delivered")
+    print(f"coalesced: {sent['events']:6} client events -> {frames:8} frames delivered "
+          f"({legacy_frames / max(1, frames):.0f}x fewer)")
+
+
+if __name__ == '__main__':
+    main()
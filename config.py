@@ -12,9 +12,25 @@ class Config:
 
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
 
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'instance', 'app.db')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        'sqlite:///' + os.path.join(basedir, 'instance', 'app.db')
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica for @read_replica views (a copy of the primary schema)
+    READ_REPLICA_URL = os.environ.get('READ_REPLICA_URL')
+
+    # SQLite tuning on every connection: 'tuned' (WAL, pragmas, pool sizing) or 'off'
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE') or 'tuned'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 64 * 1024)
+
+    # Connection pool; green threads wait up to DB_POOL_TIMEOUT seconds for a connection
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)
     
     upload_folder_from_env = os.environ.get('UPLOAD_FOLDER')
     
@@ -29,3 +45,104 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+
+    # Green-thread library for Socket.IO; must match the gunicorn worker class
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'eventlet'
+
+    # Socket.IO fan-out between worker processes. Unset = single process (in-memory).
+    # e.g. redis://localhost:6379/0, or sqlite:////tmp/socketio-queue.db for local runs and tests
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL') or 'flask-socketio'
+
+    # Socket.IO wire format for every client: 'default' (JSON) or 'msgpack' (needs
+    # `pip install msgpack`; pages then load the client build with the msgpack parser)
+    SOCKETIO_SERIALIZER = os.environ.get('SOCKETIO_SERIALIZER') or 'default'
+
+    # Number of messages rendered with the room page and returned per history page
+    MESSAGES_PAGE_SIZE = int(os.environ.get('MESSAGES_PAGE_SIZE') or 50)
+    MESSAGES_PAGE_SIZE_MAX = int(os.environ.get('MESSAGES_PAGE_SIZE_MAX') or 200)
+
+    # Results per page for full-text message search
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE') or 20)
+
+    # User directory typeahead: max results and the in-process prefix cache
+    USER_SEARCH_LIMIT = int(os.environ.get('USER_SEARCH_LIMIT') or 20)
+    USER_SEARCH_CACHE_SIZE = int(os.environ.get('USER_SEARCH_CACHE_SIZE') or 1024)
+    USER_SEARCH_CACHE_TTL = int(os.environ.get('USER_SEARCH_CACHE_TTL') or 30)
+
+    # Group member picker: candidates per page and the most members one form may add
+    MEMBER_PICKER_PAGE_SIZE = int(os.environ.get('MEMBER_PICKER_PAGE_SIZE') or 50)
+    GROUP_MAX_MEMBERS = int(os.environ.get('GROUP_MAX_MEMBERS') or 256)
+
+    # Bearer token for /chat/metrics (per-process counters). Unset = endpoint disabled
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Unread badges: seconds to coalesce unread_update emits per user (0 = send immediately)
+    UNREAD_FLUSH_INTERVAL = float(os.environ.get('UNREAD_FLUSH_INTERVAL') or 0.25)
+
+    # Batched message delivery: seconds a room's messages are collected into one
+    # message_batch frame for clients that join with batch=true (0 = one frame each)
+    MESSAGE_BATCH_INTERVAL = float(os.environ.get('MESSAGE_BATCH_INTERVAL') or 0.05)
+
+    # Write-behind ingestion for send_message: group-commit up to N messages or after M ms
+    MESSAGE_INGEST_ENABLED = os.environ.get('MESSAGE_INGEST_ENABLED') is not None
+    MESSAGE_INGEST_BATCH_SIZE = int(os.environ.get('MESSAGE_INGEST_BATCH_SIZE') or 100)
+    MESSAGE_INGEST_MAX_DELAY_MS = int(os.environ.get('MESSAGE_INGEST_MAX_DELAY_MS') or 5)
+
+    # Room membership cache for authorization checks; other workers' changes show up within the check interval
+    MEMBERSHIP_CACHE_SIZE = int(os.environ.get('MEMBERSHIP_CACHE_SIZE') or 4096)
+    MEMBERSHIP_CACHE_TTL = int(os.environ.get('MEMBERSHIP_CACHE_TTL') or 300)
+    MEMBERSHIP_VERSION_CHECK_INTERVAL = float(os.environ.get('MEMBERSHIP_VERSION_CHECK_INTERVAL') or 1.0)
+
+    # Socket.IO handlers use the (id, name) taken at connect; another worker's rename shows up within this interval
+    SOCKET_USER_CHECK_INTERVAL = float(os.environ.get('SOCKET_USER_CHECK_INTERVAL') or 1.0)
+
+    # Presence: client heartbeat period, when a silent socket is dropped, how long
+    # a disconnect waits before "offline", and how often last_seen is written
+    PRESENCE_HEARTBEAT_INTERVAL = int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL') or 25)
+    PRESENCE_TIMEOUT = int(os.environ.get('PRESENCE_TIMEOUT') or 75)
+    PRESENCE_OFFLINE_GRACE = float(os.environ.get('PRESENCE_OFFLINE_GRACE') or 5)
+    PRESENCE_FLUSH_INTERVAL = int(os.environ.get('PRESENCE_FLUSH_INTERVAL') or 30)
+
+    # Typing indicators: how often a room's aggregated typing_update may go out,
+    # and how long a typist without stop_typing stays listed
+    TYPING_UPDATE_INTERVAL = float(os.environ.get('TYPING_UPDATE_INTERVAL') or 0.5)
+    TYPING_TTL = float(os.environ.get('TYPING_TTL') or 6)
+
+    # Attachments: largest file accepted, and largest single chunk of a chunked upload
+    UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES') or 100 * 1024 * 1024)
+    UPLOAD_CHUNK_MAX_BYTES = int(os.environ.get('UPLOAD_CHUNK_MAX_BYTES') or 8 * 1024 * 1024)
+
+    # Attachment downloads: hand the bytes to the front server instead of the worker.
+    # ATTACHMENT_ACCEL_PREFIX is nginx's internal location aliasing UPLOAD_FOLDER
+    # (X-Accel-Redirect); USE_X_SENDFILE is Flask's X-Sendfile for Apache/lighttpd
+    ATTACHMENT_ACCEL_PREFIX = os.environ.get('ATTACHMENT_ACCEL_PREFIX')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') is not None
+
+    # Background jobs (app/jobs.py): concurrent jobs per process (0 = this process
+    # runs none), poll interval, retry policy, and how long finished rows are kept
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS') or 4)
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL') or 1.0)
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS') or 5)
+    JOBS_RETRY_DELAY = float(os.environ.get('JOBS_RETRY_DELAY') or 5)
+    JOBS_STALE_AFTER = int(os.environ.get('JOBS_STALE_AFTER') or 600)
+    JOBS_RETENTION = int(os.environ.get('JOBS_RETENTION') or 24 * 3600)
+    JOBS_HOUSEKEEPING_INTERVAL = int(os.environ.get('JOBS_HOUSEKEEPING_INTERVAL') or 300)
+
+    # Attachment cleanup jobs: rows per batch, how often viewed attachments and
+    # abandoned chunked uploads are swept, and their ages
+    ATTACHMENT_CLEANUP_BATCH = int(os.environ.get('ATTACHMENT_CLEANUP_BATCH') or 500)
+    ATTACHMENT_CLEANUP_INTERVAL = int(os.environ.get('ATTACHMENT_CLEANUP_INTERVAL') or 60)
+    VIEWED_ATTACHMENT_MAX_AGE = int(os.environ.get('VIEWED_ATTACHMENT_MAX_AGE') or 300)
+    UPLOAD_EXPIRE_AFTER = int(os.environ.get('UPLOAD_EXPIRE_AFTER') or 24 * 3600)
+
+    # Image previews (needs Pillow): thumbnail bounding box in pixels (0 = off),
+    # rendering processes, largest source image, and browser cache lifetime
+    PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE') or 320)
+    PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS') or 2)
+    PREVIEW_MAX_PIXELS = int(os.environ.get('PREVIEW_MAX_PIXELS') or 50_000_000)
+    PREVIEW_CACHE_MAX_AGE = int(os.environ.get('PREVIEW_CACHE_MAX_AGE') or 7 * 24 * 3600)
+
+    # Forwarding: most messages and destination chats in one request
+    FORWARD_MAX_MESSAGES = int(os.environ.get('FORWARD_MAX_MESSAGES') or 500)
+    FORWARD_MAX_ROOMS = int(os.environ.get('FORWARD_MAX_ROOMS') or 20)
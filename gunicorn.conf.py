@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for one production Socket.IO server.
+
+Engine.IO long-polling needs every request of a session to reach the same
+process, and gunicorn cannot route by session. So each gunicorn runs one
+green-thread worker (eventlet or gevent) that multiplexes thousands of
+connections. To use every core, run one gunicorn per core with serve.py and
+put a sticky (ip_hash) load balancer in front. Worker processes share
+Socket.IO rooms through SOCKETIO_MESSAGE_QUEUE.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT') or 5000}"
+
+# eventlet (default) or gevent; must match SOCKETIO_ASYNC_MODE
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'eventlet'
+workers = int(os.environ.get('GUNICORN_WORKERS') or 1)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 1000)
+
+# Long-polling requests are held open for up to the Engine.IO ping interval
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 60)
+# On SIGHUP / SIGTERM, give open requests this long to finish
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT') or 30)
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE') or 5)
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL') or 'info'
+proc_name = 'vizzchat'
+
+
+def when_ready(server):
+    if workers > 1:
+        server.log.warning(
+            'GUNICORN_WORKERS=%s: Socket.IO long-polling is not sticky across workers '
+            'of one gunicorn. Prefer serve.py (one gunicorn per core).', workers
+        )
+
+
+def worker_exit(server, worker):
+    # Join the image preview processes while the event loop still runs
+    from app.chat import previews
+    previews.shutdown()
@@ -0,0 +1,61 @@
+"""add chat message full text search
+
+Revision ID: 5b93d0e6c218
+Revises: d4e7a1c3f520
+Create Date: 2025-11-15 11:27:49.806114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b93d0e6c218'
+down_revision = 'd4e7a1c3f520'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+    "content, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_ai AFTER INSERT ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_ad AFTER DELETE ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_au AFTER UPDATE OF content ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content); END",
+    # Index the messages that already exist
+    "INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_au",
+    "DROP TRIGGER IF EXISTS chat_message_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_message_fts_ai",
+    "DROP TABLE IF EXISTS chat_message_fts",
+]
+
+POSTGRESQL_UPGRADE = [
+    "CREATE INDEX IF NOT EXISTS ix_chat_message_content_fts ON chat_message "
+    "USING gin (to_tsvector('simple', coalesce(content, '')))",
+]
+
+POSTGRESQL_DOWNGRADE = [
+    "DROP INDEX IF EXISTS ix_chat_message_content_fts",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRESQL_UPGRADE}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRESQL_DOWNGRADE}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
@@ -0,0 +1,26 @@
+"""add chat message history index
+
+Revision ID: 8c1f4e2a9b07
+Revises: 3a0ad34fd65e
+Create Date: 2025-11-12 10:04:17.218630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4e2a9b07'
+down_revision = '3a0ad34fd65e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_message_room_timestamp_id', ['room_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_room_timestamp_id')
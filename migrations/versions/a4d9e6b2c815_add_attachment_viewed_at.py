@@ -0,0 +1,31 @@
+"""add attachment viewed_at
+
+Revision ID: a4d9e6b2c815
+Revises: f7c4a9e2d381
+Create Date: 2025-11-26 10:14:52.418306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d9e6b2c815'
+down_revision = 'f7c4a9e2d381'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_message_attachment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('viewed_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_chat_message_attachment_viewed_at'), ['viewed_at'], unique=False)
+
+    # Already-viewed attachments get a full VIEWED_ATTACHMENT_MAX_AGE from now
+    op.execute("UPDATE chat_message_attachment SET viewed_at = CURRENT_TIMESTAMP WHERE viewed = 1")
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message_attachment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_chat_message_attachment_viewed_at'))
+        batch_op.drop_column('viewed_at')
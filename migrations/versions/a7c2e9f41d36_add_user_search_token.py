@@ -0,0 +1,64 @@
+"""add user search token
+
+Revision ID: a7c2e9f41d36
+Revises: 5b93d0e6c218
+Create Date: 2025-11-17 09:51:32.472085
+
+"""
+import re
+import unicodedata
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e9f41d36'
+down_revision = '5b93d0e6c218'
+branch_labels = None
+depends_on = None
+
+
+def _normalize(value):
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _tokens(name, username, email, public_id):
+    # Frozen copy of app.models.user_search_tokens at the time of this revision
+    tokens = set(re.findall(r'\w+', _normalize(name)))
+    for value in (username, email, public_id):
+        value = _normalize(value)
+        if value:
+            tokens.add(value)
+    if email:
+        tokens.add(_normalize(email.split('@')[0]))
+    return {t[:100] for t in tokens if t}
+
+
+def upgrade():
+    token_table = op.create_table('user_search_token',
+    sa.Column('token', sa.String(length=100), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('token', 'user_id')
+    )
+    with op.batch_alter_table('user_search_token', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_search_token_user_id'), ['user_id'], unique=False)
+
+    # Backfill tokens for existing users
+    conn = op.get_bind()
+    users = conn.execute(sa.text('SELECT id, name, username, email, public_id FROM "user"')).fetchall()
+    rows = [
+        {'token': token, 'user_id': u.id}
+        for u in users
+        for token in _tokens(u.name, u.username, u.email, u.public_id)
+    ]
+    if rows:
+        op.bulk_insert(token_table, rows)
+
+
+def downgrade():
+    with op.batch_alter_table('user_search_token', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_search_token_user_id'))
+
+    op.drop_table('user_search_token')
@@ -0,0 +1,29 @@
+"""add cache version
+
+Revision ID: b6d2e8a4c173
+Revises: f3a9c2d71b58
+Create Date: 2025-11-20 09:42:18.615204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2e8a4c173'
+down_revision = 'f3a9c2d71b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO cache_version (name, version) VALUES ('membership', 0)")
+
+
+def downgrade():
+    op.drop_table('cache_version')
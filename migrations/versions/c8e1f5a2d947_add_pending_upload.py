@@ -0,0 +1,40 @@
+"""add pending upload
+
+Revision ID: c8e1f5a2d947
+Revises: b6d2e8a4c173
+Create Date: 2025-11-21 11:05:42.308716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e1f5a2d947'
+down_revision = 'b6d2e8a4c173'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pending_upload',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('room_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['room_id'], ['chat_room.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('pending_upload', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pending_upload_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pending_upload', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pending_upload_created_at'))
+
+    op.drop_table('pending_upload')
@@ -0,0 +1,40 @@
+"""add attachment blob
+
+Revision ID: d2f7b9e3a615
+Revises: c8e1f5a2d947
+Create Date: 2025-11-22 10:17:03.482951
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f7b9e3a615'
+down_revision = 'c8e1f5a2d947'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('attachment_blob',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    # Existing attachments keep their <room>/<name> files (blob_sha256 NULL);
+    # they move into the store the first time they are forwarded.
+    with op.batch_alter_table('chat_message_attachment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_sha256', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_chat_message_attachment_blob_sha256'), ['blob_sha256'], unique=False)
+        batch_op.create_foreign_key('fk_chat_message_attachment_blob_sha256', 'attachment_blob', ['blob_sha256'], ['sha256'])
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message_attachment', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_chat_message_attachment_blob_sha256', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_chat_message_attachment_blob_sha256'))
+        batch_op.drop_column('blob_sha256')
+
+    op.drop_table('attachment_blob')
@@ -0,0 +1,47 @@
+"""add chat room last activity
+
+Revision ID: d4e7a1c3f520
+Revises: 8c1f4e2a9b07
+Create Date: 2025-11-13 16:42:03.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e7a1c3f520'
+down_revision = '8c1f4e2a9b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_room', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_chat_room_last_activity', ['last_activity_at', 'id'], unique=False)
+
+    # Backfill existing rooms from their newest message (uses ix_chat_message_room_timestamp_id)
+    op.execute("""
+        UPDATE chat_room SET last_message_id = (
+            SELECT m.id FROM chat_message m
+            WHERE m.room_id = chat_room.id
+            ORDER BY m.timestamp DESC, m.id DESC
+            LIMIT 1
+        )
+    """)
+    op.execute("""
+        UPDATE chat_room SET last_activity_at = (
+            SELECT m.timestamp FROM chat_message m
+            WHERE m.id = chat_room.last_message_id
+        )
+        WHERE last_message_id IS NOT NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_room', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_room_last_activity')
+        batch_op.drop_column('last_activity_at')
+        batch_op.drop_column('last_message_id')
@@ -0,0 +1,26 @@
+"""add user name index
+
+Revision ID: e1b8f3a05c94
+Revises: a7c2e9f41d36
+Create Date: 2025-11-18 14:06:55.130447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b8f3a05c94'
+down_revision = 'a7c2e9f41d36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_name_id', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_name_id')
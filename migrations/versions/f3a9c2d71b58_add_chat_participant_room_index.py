@@ -0,0 +1,26 @@
+"""add chat participant room index
+
+Revision ID: f3a9c2d71b58
+Revises: e1b8f3a05c94
+Create Date: 2025-11-19 10:21:37.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c2d71b58'
+down_revision = 'e1b8f3a05c94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_participant', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_participant_room_user', ['room_id', 'user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_participant', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_participant_room_user')
@@ -0,0 +1,32 @@
+"""add attachment blob preview
+
+Revision ID: f7c4a9e2d381
+Revises: e5a3c8f1b294
+Create Date: 2025-11-24 16:08:37.254190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c4a9e2d381'
+down_revision = 'e5a3c8f1b294'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('attachment_blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('preview_status', sa.String(length=10), nullable=True))
+        batch_op.add_column(sa.Column('preview_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('preview_height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('blurhash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('attachment_blob', schema=None) as batch_op:
+        batch_op.drop_column('blurhash')
+        batch_op.drop_column('preview_height')
+        batch_op.drop_column('preview_width')
+        batch_op.drop_column('preview_status')
@@ -1,3 +1,7 @@
+import eventlet
+# Patch blocking I/O first so message-queue clients and background threads cooperate with the eventlet hub
+eventlet.monkey_patch()
+
 from app import create_app, db, socketio
 from app.models import User, ChatRoom, ChatMessage, ChatParticipant
 
@@ -15,7 +19,11 @@ def make_shell_context():
 
 if __name__ == '__main__':
     print("Starting Flask-SocketIO server...")
-    socketio.run(app, host='0.0.0.0', port=5000, debug=False, use_reloader=False, log_output=True)
+    try:
+        socketio.run(app, host='0.0.0.0', port=5000, debug=False, use_reloader=False, log_output=True)
+    finally:
+        from app.chat import previews
+        previews.shutdown()
 
 
 
@@ -0,0 +1,126 @@
+"""
+Production launcher: one gunicorn Socket.IO server per CPU core.
+
+Each instance listens on its own port (base port + index) with a single
+green-thread worker, see gunicorn.conf.py. Put a load balancer with sticky
+sessions in front; --nginx-conf writes a ready-to-include upstream block
+using ip_hash. With more than one instance, SOCKETIO_MESSAGE_QUEUE must be
+set so rooms work across processes.
+
+    python serve.py --workers 4 --base-port 5000 --nginx-conf /etc/nginx/conf.d/vizzchat.conf
+
+Signals: SIGHUP gracefully reloads every instance (gunicorn replaces its
+workers once in-flight requests finish); SIGINT/SIGTERM stop them gracefully.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+NGINX_TEMPLATE = """upstream vizzchat {{
+    # Engine.IO long-polling requires every request of a session on the same backend
+    ip_hash;
+{servers}
+}}
+
+server {{
+    listen 80;
+
+    location / {{
+        proxy_pass http://vizzchat;
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    }}
+
+    location /socket.io {{
+        proxy_pass http://vizzchat/socket.io;
+        proxy_http_version 1.1;
+        proxy_buffering off;
+        proxy_read_timeout 120s;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "Upgrade";
+        proxy_set_header Host $host;
+    }}
+
+    # Attachment downloads handed over with X-Accel-Redirect (ATTACHMENT_ACCEL_PREFIX)
+    location {accel_prefix} {{
+        internal;
+        alias {upload_folder}/;
+    }}
+}}
+"""
+
+
+def write_nginx_conf(path, host, ports):
+    from config import Config
+
+    servers = '\n'.join(f"    server {host}:{port};" for port in ports)
+    accel_prefix = (Config.ATTACHMENT_ACCEL_PREFIX or '/_protected_uploads/').rstrip('/') + '/'
+    with open(path, 'w') as f:
+        f.write(NGINX_TEMPLATE.format(servers=servers, accel_prefix=accel_prefix,
+                                      upload_folder=Config.UPLOAD_FOLDER.rstrip('/')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVE_WORKERS') or multiprocessing.cpu_count()),
+                        help='gunicorn instances to run (default: CPU count)')
+    parser.add_argument('--host', default=os.environ.get('SERVE_HOST') or '127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=int(os.environ.get('SERVE_BASE_PORT') or 5000))
+    parser.add_argument('--worker-connections', type=int,
+                        help='concurrent connections per instance (GUNICORN_WORKER_CONNECTIONS)')
+    parser.add_argument('--nginx-conf', help='write an nginx upstream/server config for these instances')
+    args = parser.parse_args()
+
+    if args.workers > 1 and not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+        sys.exit('SOCKETIO_MESSAGE_QUEUE must be set to run more than one instance.')
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    if args.nginx_conf:
+        write_nginx_conf(args.nginx_conf, args.host, ports)
+        print(f"Wrote nginx config for {len(ports)} backends to {args.nginx_conf}")
+
+    children = []
+    for port in ports:
+        env = dict(os.environ, GUNICORN_BIND=f"{args.host}:{port}", GUNICORN_WORKERS='1')
+        if args.worker_connections:
+            env['GUNICORN_WORKER_CONNECTIONS'] = str(args.worker_connections)
+        children.append(subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(basedir, 'gunicorn.conf.py'), 'wsgi:app'],
+            cwd=basedir, env=env
+        ))
+    print(f"Started {len(children)} instances on {args.host}:{ports[0]}-{ports[-1]}")
+
+    stopping = False
+
+    def forward(signum, frame):
+        nonlocal stopping
+        if signum in (signal.SIGINT, signal.SIGTERM):
+            stopping = True
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signal.SIGHUP if signum == signal.SIGHUP else signal.SIGTERM)
+
+    signal.signal(signal.SIGHUP, forward)
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+
+    # If one instance dies unexpectedly, take the rest down so a supervisor can restart us
+    while not stopping:
+        if any(child.poll() is not None for child in children):
+            print('An instance exited; stopping the others.', file=sys.stderr)
+            forward(signal.SIGTERM, None)
+            break
+        time.sleep(1)
+
+    for child in children:
+        child.wait()
+
+
+if __name__ == '__main__':
+    main()